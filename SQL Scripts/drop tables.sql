@@ -1,6 +1,8 @@
 USE TRACK_TIME_365
 GO
 
+DROP TABLE IF EXISTS [dbo].[calendar_user_timezone]
+DROP TABLE IF EXISTS [dbo].[calendar_sync_state]
 DROP TABLE IF EXISTS [dbo].[calendar_event_calendar_category]
 DROP TABLE IF EXISTS [dbo].[calendar_category] 
 DROP TABLE IF EXISTS [dbo].[calendar_event]
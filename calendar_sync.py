@@ -1,21 +1,185 @@
 from O365 import Account, FileSystemTokenBackend, MSGraphProtocol
 from datetime import datetime, timezone, timedelta
-from config import CLIENT_ID, CLIENT_SECRET, logger
+from concurrent.futures import ThreadPoolExecutor
+from config import CLIENT_ID, CLIENT_SECRET, DB_POOL_SIZE, DELTA_RESYNC_DAYS, SYNC_MAX_WORKERS, USER_TIMEZONE_MAX_AGE_DAYS, WINDOWS_ZONES_PATH, logger
 from database import DatabaseManager
+import atexit
+import json
+import queue
+import threading
 import os
-import re
 from zoneinfo import ZoneInfo
 from tzlocal import get_localzone
 import tzlocal.windows_tz
-import urllib.request
-import xml.etree.ElementTree as ET
+import requests
+from requests.adapters import HTTPAdapter
+import email.utils
 import functools
+import random
 import time
+import weakref
 import logging
 
+try:
+    import ciso8601  # C parser for the ISO 8601 timestamps returned by Graph
+except ImportError:
+    ciso8601 = None
+
+try:
+    import orjson  # C JSON decoder for the large $batch responses
+except ImportError:
+    orjson = None
+
+GRAPH_ENDPOINT = 'https://graph.microsoft.com/v1.0'
+GRAPH_BATCH_ENDPOINT = f'{GRAPH_ENDPOINT}/$batch'
+# Users with a mailbox; filtering on mail is an advanced query that needs $count and ConsistencyLevel
+GRAPH_USERS_URL = (
+    f'{GRAPH_ENDPOINT}/users?$select=id,displayName,mail,userPrincipalName'
+    '&$filter=mail ne null&$count=true&$top=999'
+)
+# Relative calendarView delta URL used inside $batch, formatted per user
+CALENDAR_VIEW_DELTA_URL = '/users/{user_email}/calendarView/delta?startDateTime={start}&endDateTime={end}'
+GRAPH_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
+MAX_NAME_LENGTH = 255  # Size of the NVARCHAR subject/user_name columns
+GRAPH_BATCH_LIMIT = 20  # Maximum number of requests in one Graph $batch call
+EVENTS_PAGE_SIZE = 100  # Events per calendarView page, fewer pages mean fewer nextLink round trips
+
+HTTP_POOL_SIZE = 32  # Keep-alive connections kept per host
+PIPELINE_QUEUE_SIZE = 4  # Event pages fetched ahead of the writer thread
+
+AUTH_EXPIRY_MARGIN = 60  # Re-check the token this many seconds before it expires
+AUTH_RECHECK_SECONDS = 300  # Re-check interval when the token expiry is unknown
+
+def _load_windows_zones():
+    """Return the CLDR Windows->IANA mapping stored by update_windows_zones.py, if any."""
+    if not os.path.exists(WINDOWS_ZONES_PATH):
+        return {}
+    try:
+        with open(WINDOWS_ZONES_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to load timezone mapping from {WINDOWS_ZONES_PATH}: {str(e)}")
+        return {}
+
+def _response_json(response):
+    """Decode a Graph response body, with orjson when it is installed."""
+    if orjson and isinstance(response.content, bytes):
+        return orjson.loads(response.content)
+    return response.json()
+
+@functools.lru_cache(maxsize=None)
+def _system_timezone():
+    """Return the IANA name of the system timezone, detected once per process."""
+    return str(get_localzone())
+
+@functools.lru_cache(maxsize=None)
+def _zoneinfo(name):
+    """Return a shared ZoneInfo instance for an IANA timezone name.
+    Unbounded, since there are only a few hundred IANA names and no LRU bookkeeping is needed."""
+    return ZoneInfo(name)
+
+@functools.lru_cache(maxsize=128)
+def _utc_query_range(start_date, end_date, timezone_name):
+    """Return the Graph startDateTime/endDateTime strings covering whole days in a timezone.
+
+    The range starts at 00:00 on start_date and ends at 00:00 the day after end_date.
+    """
+    user_tz = _zoneinfo(timezone_name)
+
+    # Convert dates to datetime with explicit boundaries in user's timezone
+    start_time = datetime.combine(start_date, datetime.min.time(), tzinfo=user_tz)
+    end_time = datetime.combine(end_date + timedelta(days=1), datetime.min.time(), tzinfo=user_tz)
+
+    # Convert times to UTC for the API request
+    start_time_utc = start_time.astimezone(timezone.utc)
+    end_time_utc = end_time.astimezone(timezone.utc)
+
+    return (
+        start_time_utc.strftime(GRAPH_DATETIME_FORMAT),
+        end_time_utc.strftime(GRAPH_DATETIME_FORMAT)
+    )
+
+@functools.lru_cache(maxsize=65536)
+def _parse_graph_datetime(date_str):
+    """Parse a UTC timestamp from Graph into an aware datetime.
+
+    Memoized, as many events share the same start, end or modification times.
+    """
+    if ciso8601:
+        return ciso8601.parse_datetime_as_naive(date_str).replace(tzinfo=timezone.utc)
+    # Remove the trailing Z if present and parse. Graph sends 7 fractional digits, which
+    # fromisoformat only accepts from Python 3.11 on, so keep the microseconds only
+    seconds, dot, fraction = date_str.rstrip('Z').partition('.')
+    return datetime.fromisoformat(seconds + dot + fraction[:6]).replace(tzinfo=timezone.utc)
+
+def _build_windows_to_iana():
+    """Build the Windows->IANA mapping from tzlocal's table, with the stored CLDR mapping
+    only filling in names tzlocal does not know."""
+    return {
+        **_load_windows_zones(),
+        **tzlocal.windows_tz.win_tz,
+        # Prefer Amsterdam over CLDR's Europe/Berlin for W. Europe Standard Time
+        'W. Europe Standard Time': 'Europe/Amsterdam',
+    }
+
+# Live InMemoryTokenBackend instances, flushed by a single exit hook without keeping them alive
+_token_backends = weakref.WeakSet()
+
+def _flush_token_backends():
+    """Write the tokens still held in memory when the interpreter exits."""
+    for backend in list(_token_backends):
+        backend.flush()
+
+atexit.register(_flush_token_backends)
+
+class InMemoryTokenBackend(FileSystemTokenBackend):
+    """File token backend that keeps refreshed tokens in memory until flush() writes them.
+
+    Sync workers share one Connection, so a refresh would otherwise rewrite o365_token.txt
+    from whichever thread got there first. CalendarSync flushes after authenticating and after
+    each sync; the exit hook only catches what is left.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+        self._dirty = False
+        _token_backends.add(self)
+
+    def load_token(self):
+        with self._lock:
+            # The file is stale while a newer token only lives in memory
+            if self._dirty:
+                return self.token
+            return super().load_token()
+
+    def save_token(self):
+        with self._lock:
+            if self.token is None:
+                raise ValueError('You have to set the "token" first.')
+            self._dirty = True
+            return True
+
+    def flush(self):
+        """Write the in-memory token to the token file if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                super().save_token()
+                self._dirty = False
+            except Exception as e:
+                logger.warning(f"Could not write token file {self.token_path}: {str(e)}")
+
 class CalendarSync:
+    # Windows timezone name -> IANA timezone name, built once at import from tzlocal's table
+    # and the fresher CLDR mapping stored by update_windows_zones.py
+    _WIN_TO_IANA = _build_windows_to_iana()
+
     def __init__(self):
-        self.db = DatabaseManager()
+        # Two pooled connections per sync worker, one for its fetch thread and one for its
+        # event writer, so parallel user groups never wait on each other
+        self.db = DatabaseManager(pool_size=max(DB_POOL_SIZE, 2 * SYNC_MAX_WORKERS))
         self.credentials = (CLIENT_ID, CLIENT_SECRET)
         self.scopes = [
             'https://graph.microsoft.com/.default'  # This will request all configured application permissions
@@ -23,7 +187,7 @@ class CalendarSync:
         
         # Set up token backend with tenant-specific configuration
         token_path = os.path.join(os.path.dirname(__file__), 'o365_token.txt')
-        token_backend = FileSystemTokenBackend(token_path=token_path)
+        self._token_backend = InMemoryTokenBackend(token_path=token_path)
         self.protocol = MSGraphProtocol()
         
         # Initialize the Account with application-level auth
@@ -31,68 +195,111 @@ class CalendarSync:
             credentials=self.credentials,
             auth_flow_type='credentials',
             tenant_id='thecodecraftfoundry.onmicrosoft.com',  # Use actual tenant ID for client credentials
-            token_backend=token_backend,
-            protocol=self.protocol
+            token_backend=self._token_backend,
+            protocol=self.protocol,
+            # O365 waits 200 ms between requests by default, which serialises the sync worker
+            # threads; Graph throttling is handled by the 429 retries instead
+            requests_delay=0
         )
         
-        # Rate limit settings
-        self.max_retries = 3
-        self.retry_delay = 5  # seconds
+        # time.monotonic() until which the current access token is trusted without asking O365
+        self._authed_until = 0.0
 
-    def _make_request_with_retry(self, endpoint, params=None):
-        """Make a request with retry logic for rate limits."""
-        retries = 0
-        while retries < self.max_retries:
+        # O365 session that already has the pooled HTTP adapter mounted
+        self._pooled_session = None
+
+        # Resolved IANA timezone per user email
+        self._user_tz_cache = {}
+
+        # Rate limit settings: exponential backoff with jitter unless Graph sends Retry-After
+        self.max_retries = 6
+        self.base_delay = 1.0  # seconds
+        self.max_delay = 60.0  # seconds
+        self.jitter = 0.5  # Up to 50% extra delay, so throttled workers don't retry in lockstep
+
+    def _retry_delay(self, retries, retry_after=None):
+        """Seconds to wait before retry number `retries` (starting at 0).
+
+        Honors the Retry-After value sent by Graph, either delay seconds or an HTTP date,
+        otherwise backs off exponentially with jitter.
+        """
+        if retry_after is not None:
+            retry_after = str(retry_after).strip()
+            if retry_after.isdigit():
+                return int(retry_after)
             try:
-                response = self.account.connection.get(endpoint, params=params)
-                if response:
-                    return response
-                elif response.status_code == 429:  # Rate limit exceeded
-                    retry_after = int(response.headers.get('Retry-After', self.retry_delay))
-                    logger.warning(f"Rate limit exceeded. Waiting {retry_after} seconds before retry.")
-                    time.sleep(retry_after)
-                    retries += 1
-                    continue
-                else:
-                    logger.error(f"Request failed with status code: {response.status_code}")
-                    return None
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+        delay = min(self.max_delay, self.base_delay * (2 ** retries))
+        return delay * (1 + random.random() * self.jitter)
+
+    def _make_request_with_retry(self, endpoint, params=None, method='get', **kwargs):
+        """Make a Graph request through the O365 connection, retrying throttling and server errors.
+
+        Extra keyword arguments (headers, json, ...) are passed on to the connection method.
+        """
+        request = getattr(self.account.connection, method)
+        for retries in range(self.max_retries):
+            try:
+                response = request(endpoint, params=params, **kwargs)
+            except requests.HTTPError as e:
+                # The O365 connection raises for error statuses, keep the response to inspect it
+                response = e.response
             except Exception as e:
                 logger.error(f"Request failed: {str(e)}")
                 return None
+
+            if response is None:
+                logger.error("Request failed: no response")
+                return None
+
+            # Check the status before returning, a throttled response must be retried
+            if response.status_code == 429 or 500 <= response.status_code < 600:  # Throttled or server error
+                if retries + 1 < self.max_retries:
+                    retry_after = self._retry_delay(retries, response.headers.get('Retry-After'))
+                    logger.warning(f"Request failed with retryable status {response.status_code}. Waiting {retry_after:.1f} seconds before retry.")
+                    time.sleep(retry_after)
+                continue
+
+            if not response.ok:
+                logger.error(f"Request failed with status code: {response.status_code}")
+                return None
+            return response
+
         logger.error("Max retries exceeded for request")
         return None
 
-    @staticmethod
-    @functools.lru_cache(maxsize=128)
-    def windows_to_iana(windows_tz):
-        """Convert Windows timezone name to IANA timezone name using Unicode CLDR data.
-        Uses caching to avoid repeated HTTP requests."""
-        try:
-            url = 'https://raw.githubusercontent.com/unicode-org/cldr/master/common/supplemental/windowsZones.xml'
-            headers = {'User-Agent': 'Mozilla/5.0'}  # Add user agent to avoid potential blocking
-            request = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(request, timeout=5) as response:
-                xml_data = response.read().decode('utf-8')
-            
-            root = ET.fromstring(xml_data)
-            # Find all mapZone elements and check their attributes
-            for mapping in root.findall(".//mapZone"):
-                if mapping.get('other') == windows_tz and mapping.get('territory') == '001':
-                    logger.debug(f"Found CLDR mapping for {windows_tz}: {mapping.get('type')}")
-                    return mapping.get('type')
-            
-            logger.debug(f"No CLDR mapping found for {windows_tz}")
-            return None
-        except Exception as e:
-            logger.warning(f"Failed to fetch timezone mapping from Unicode CLDR: {str(e)}")
-            return None
+    @classmethod
+    def reload_windows_zones(cls):
+        """Rebuild the Windows->IANA mapping after update_windows_zones.py stored a new one."""
+        cls._WIN_TO_IANA = _build_windows_to_iana()
+
+    @classmethod
+    def windows_to_iana(cls, windows_tz):
+        """Convert Windows timezone name to IANA timezone name, or None if it is unknown."""
+        return cls._WIN_TO_IANA.get(windows_tz)
 
     def authenticate(self):
-        """Authenticate with Office 365 using client credentials."""
+        """Authenticate with Office 365 using client credentials.
+
+        Until the access token is about to expire only the first successful call talks to
+        Office 365, so the per-request guards in the Graph helpers are cheap.
+        """
+        if time.monotonic() < self._authed_until:
+            # The O365 connection creates its session lazily and replaces it when the token is
+            # renewed, so make sure the current one is pooled (an identity check once it is)
+            self._configure_session()
+            return True
+
         try:
             # Check if we have a valid token
             if self.account.is_authenticated:
                 logger.info("Already authenticated with Office 365")
+                self._configure_session()
+                self._authed_until = time.monotonic() + self._token_lifetime()
+                self._token_backend.flush()
                 return True
 
             # Authenticate with client credentials
@@ -100,6 +307,9 @@ class CalendarSync:
             
             if result:
                 logger.info("Successfully authenticated with Office 365")
+                self._configure_session()
+                self._authed_until = time.monotonic() + self._token_lifetime()
+                self._token_backend.flush()
             else:
                 logger.error("Authentication failed")
             return result
@@ -107,9 +317,40 @@ class CalendarSync:
             logger.error(f"Authentication error: {str(e)}")
             return False
 
+    def _token_lifetime(self):
+        """Seconds the current access token can still be used, minus a safety margin."""
+        try:
+            expires_at = self.account.connection.token_backend.token.get('expires_at')
+            return max(0.0, float(expires_at) - time.time() - AUTH_EXPIRY_MARGIN)
+        except (AttributeError, TypeError, ValueError):
+            return AUTH_RECHECK_SECONDS
+
+    def _configure_session(self):
+        """Give the O365 HTTP session a connection pool large enough to keep Graph connections alive.
+
+        The O365 library creates its requests session lazily, so this is re-checked after every
+        authentication and applied once per session object.
+        """
+        try:
+            session = self.account.connection.session
+            if session is None or session is self._pooled_session:
+                return
+
+            # Keep the retry policy configured by the O365 library
+            current_adapter = session.get_adapter(GRAPH_ENDPOINT)
+            session.mount('https://', HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=current_adapter.max_retries
+            ))
+            self._pooled_session = session
+            logger.debug("Configured pooled HTTP session for Microsoft Graph")
+        except Exception as e:
+            logger.warning(f"Could not configure HTTP connection pool: {str(e)}")
+
     def get_users(self):
         """Get all users with mailboxes using Microsoft Graph API."""
-        if not self.account.is_authenticated:
+        if not self.authenticate():
             raise Exception("Not authenticated")
         
         try:
@@ -121,56 +362,52 @@ class CalendarSync:
             raise
 
     def get_user_timezone(self, user_email):
-        """Get the timezone setting for a specific user."""
+        """Get the timezone setting for a specific user.
+        Resolved timezones are cached per user for the lifetime of this instance."""
+        cached_timezone = self._user_tz_cache.get(user_email)
+        if cached_timezone:
+            return cached_timezone
+
         try:
             if not self.authenticate():
                 logger.error("Not authenticated with Office 365")
-                return str(get_localzone())  # Return system timezone as fallback
+                return _system_timezone()  # Return system timezone as fallback
 
             # Use Microsoft Graph API to get user's mailbox settings
-            endpoint = f"https://graph.microsoft.com/v1.0/users/{user_email}/mailboxSettings"
-            response = self.account.connection.get(endpoint)
+            endpoint = f"{GRAPH_ENDPOINT}/users/{user_email}/mailboxSettings"
+            response = self._make_request_with_retry(endpoint)
             
             if response:
-                windows_timezone = response.json().get('timeZone', None)
+                windows_timezone = _response_json(response).get('timeZone', None)
                 logger.info(f"Retrieved timezone {windows_timezone} for user {user_email}")
-                
-                if windows_timezone:
-                    # Special case for W. Europe Standard Time
-                    if windows_timezone == 'W. Europe Standard Time':
-                        logger.info(f"Using Europe/Amsterdam for W. Europe Standard Time for user {user_email}")
-                        return 'Europe/Amsterdam'
-                    
-                    # Try tzlocal mapping first as it's more reliable for Windows timezones
-                    try:
-                        iana_timezones = tzlocal.windows_tz.win_tz.get(windows_timezone)
-                        if iana_timezones:
-                            iana_timezone = iana_timezones[0]
-                            logger.info(f"Mapped Windows timezone '{windows_timezone}' to IANA timezone '{iana_timezone}' using tzlocal for user {user_email}")
-                            return iana_timezone
-                    except Exception as e:
-                        logger.warning(f"Failed to map timezone using tzlocal: {str(e)}")
-                        
-                    # Fallback to Unicode CLDR mapping
-                    try:
-                        iana_timezone = self.windows_to_iana(windows_timezone)
-                        if iana_timezone:
-                            logger.info(f"Mapped Windows timezone '{windows_timezone}' to IANA timezone '{iana_timezone}' using Unicode CLDR for user {user_email}")
-                            return iana_timezone
-                    except Exception as e:
-                        logger.warning(f"Failed to map timezone using CLDR: {str(e)}")
-                
-                # If conversion fails or no timezone set, use system timezone
-                system_timezone = str(get_localzone())
-                logger.info(f"Using system timezone {system_timezone} for user {user_email}")
-                return system_timezone
+                return self._resolve_user_timezone(user_email, windows_timezone)
             else:
                 logger.warning(f"Error getting user timezone: {response.text if hasattr(response, 'text') else 'No response'}, using system timezone")
-                return str(get_localzone())
+                return _system_timezone()
                 
         except Exception as e:
             logger.warning(f"Error getting user timezone: {str(e)}, using system timezone")
-            return str(get_localzone())
+            return _system_timezone()
+
+    def invalidate_user_tz(self, user_email=None):
+        """Forget the cached timezone of a user, or of all users if no email is given."""
+        if user_email is None:
+            self._user_tz_cache.clear()
+        else:
+            self._user_tz_cache.pop(user_email, None)
+
+    def _resolve_user_timezone(self, user_email, windows_timezone):
+        """Map a user's Windows timezone to IANA and cache the result for the user."""
+        iana_timezone = self.windows_to_iana(windows_timezone) if windows_timezone else None
+        if iana_timezone:
+            logger.info(f"Mapped Windows timezone '{windows_timezone}' to IANA timezone '{iana_timezone}' for user {user_email}")
+        else:
+            # If conversion fails or no timezone set, use system timezone
+            iana_timezone = _system_timezone()
+            logger.info(f"Using system timezone {iana_timezone} for user {user_email}")
+
+        self._user_tz_cache[user_email] = iana_timezone
+        return iana_timezone
 
     def get_calendar(self, user_email):
         """Get the default calendar for a user."""
@@ -198,64 +435,150 @@ class CalendarSync:
             logger.error(f"Error getting calendar for user {user_email}: {str(e)}")
             return None
 
+    def _build_event_data(self, event, user_email, now=None):
+        """Extract the database row for a calendar event, or None if the event is invalid.
+
+        `now` is used as last_modified for events without a lastModifiedDateTime.
+        """
+        event_id = event.get('id')
+        if not event_id:
+            logger.error("Event missing ID - skipping")
+            return None
+
+        start_date = self._parse_date((event.get('start') or {}).get('dateTime'))
+        end_date = self._parse_date((event.get('end') or {}).get('dateTime'))
+        if not start_date or not end_date:
+            logger.error(f"Event {event_id} missing start or end date - skipping")
+            return None
+        # Both datetimes share timezone.utc, so this is a plain comparison
+        if end_date < start_date:
+            logger.error(f"Event {event_id} ends before it starts - skipping")
+            return None
+
+        # Graph sends null for some empty properties, so fall back with `or` rather than defaults
+        organizer = (event.get('organizer') or {}).get('emailAddress') or {}
+        return {
+            'event_id': event_id,
+            'user_email': user_email,
+            'user_name': (organizer.get('name') or '')[:MAX_NAME_LENGTH],
+            'subject': (event.get('subject') or '')[:MAX_NAME_LENGTH],
+            'description': (event.get('body') or {}).get('content') or '',
+            'start_date': start_date,
+            'end_date': end_date,
+            'last_modified': self._parse_date(event.get('lastModifiedDateTime')) or now or datetime.now(timezone.utc),
+            'is_deleted': False,
+            'change_key': event.get('changeKey'),
+            'categories': event.get('categories', [])
+        }
+
+    def _store_event(self, event_data):
+        """Write a single event row to the database."""
+        try:
+            updated = self.db.upsert_event(event_data)
+            if updated:
+                logger.debug("Updated event: %s for user %s", event_data['subject'], event_data['user_email'])
+            else:
+                logger.debug("No changes needed for event: %s", event_data['subject'])
+            return True
+        except Exception as e:
+            logger.error(f"Database error while processing event {event_data['subject']}: {str(e)}")
+            return False
+
     def process_event(self, event, user_email):
         """Process a single calendar event."""
         try:
-            event_id = event.get('id')
-            if not event_id:
-                logger.error("Event missing ID - skipping")
+            event_data = self._build_event_data(event, user_email)
+            if not event_data:
                 return False
 
-            # Extract event details
-            event_data = {
-                'event_id': event_id,
-                'user_email': user_email,
-                'user_name': event.get('organizer', {}).get('emailAddress', {}).get('name', ''),
-                'subject': event.get('subject', ''),
-                'description': event.get('body', {}).get('content', ''),
-                'start_date': self._parse_date(event.get('start', {}).get('dateTime')),
-                'end_date': self._parse_date(event.get('end', {}).get('dateTime')),
-                'last_modified': self._parse_date(event.get('lastModifiedDateTime', datetime.now(timezone.utc).isoformat())),
-                'is_deleted': False,
-                'categories': event.get('categories', [])
-            }
-
-            logger.debug(f"Processing event - Subject: {event_data['subject']}")
-            logger.debug(f"Raw categories from API: {event_data['categories']}")
+            logger.debug("Processing event - Subject: %s", event_data['subject'])
+            logger.debug("Raw categories from API: %s", event_data['categories'])
 
             # Process the event in the database
-            try:
-                updated = self.db.upsert_event(event_data)
-                if updated:
-                    logger.info(f"{'Updated' if event_id else 'Inserted new'} event: {event_data['subject']} for user {user_email}")
-                else:
-                    logger.debug(f"No changes needed for event: {event_data['subject']}")
-                return True
-            except Exception as e:
-                logger.error(f"Database error while processing event {event_data['subject']}: {str(e)}")
-                return False
+            return self._store_event(event_data)
 
         except Exception as e:
             logger.error(f"Error processing event: {str(e)}")
             return False
 
     def process_events(self, events, user_email):
-        """Process a list of calendar events sequentially."""
+        """Process a list of calendar events, storing them with a single bulk upsert.
+
+        Entries marked '@removed' by a delta query are marked as deleted in the database.
+        If the bulk upsert fails, the events are stored one by one so a single bad event
+        does not prevent the others from being saved.
+
+        Returns:
+            bool: True if every valid event was stored successfully.
+        """
         if not events:
-            return
+            return True
+
+        removed_ids = [event['id'] for event in events if '@removed' in event]
+        if removed_ids:
+            try:
+                self.db.mark_events_deleted(removed_ids)
+                logger.info(f"Marked {len(removed_ids)} removed events as deleted for user {user_email}")
+            except Exception as e:
+                logger.error(f"Database error while marking removed events for user {user_email}: {str(e)}")
+                return False
+            events = [event for event in events if '@removed' not in event]
 
-        success_count = 0
         total_events = len(events)
+        now = datetime.now(timezone.utc)  # Shared fallback timestamp for the whole page of events
+        rows = []
+        for event in events:
+            try:
+                event_data = self._build_event_data(event, user_email, now)
+            except Exception as e:
+                logger.error(f"Error processing event: {str(e)}")
+                continue
+            if event_data:
+                rows.append(event_data)
+
+        changed_rows = self._changed_rows(rows)
+        success_count = len(rows) - len(changed_rows)
+        if changed_rows:
+            try:
+                self.db.upsert_events_batch(changed_rows)
+                success_count += len(changed_rows)
+            except Exception as e:
+                logger.warning(f"Bulk upsert failed for user {user_email}: {str(e)}, storing events one by one")
+                success_count += sum(1 for event_data in changed_rows if self._store_event(event_data))
         
-        for i, event in enumerate(events, 1):
-            logger.info(f"Processing event {i} of {total_events}")
-            if self.process_event(event, user_email):
-                success_count += 1
-            # Add a small delay between events to reduce database load
-            if i < total_events:  # Don't sleep after the last event
-                time.sleep(0.1)
-        
-        logger.info(f"Successfully processed {success_count} out of {total_events} events")
+        logger.info(f"Successfully processed {success_count} out of {total_events} events "
+                    f"({len(rows) - len(changed_rows)} unchanged)")
+        # Invalid events are skipped for good, only failed database writes count as a failure
+        return success_count == len(rows)
+
+    def _changed_rows(self, rows):
+        """Return the event rows that differ from the stored version of the event.
+
+        Events are compared on the Graph changeKey, or on lastModifiedDateTime when either
+        side has no changeKey.
+        """
+        if not rows:
+            return rows
+        try:
+            stored = self.db.get_event_versions([row['event_id'] for row in rows])
+        except Exception as e:
+            logger.warning(f"Could not read stored events ({str(e)}), storing all of them")
+            return rows
+
+        changed = []
+        for row in rows:
+            version = stored.get(row['event_id'])
+            if version is None:
+                changed.append(row)
+                continue
+            last_modified, change_key = version
+            if change_key and row['change_key']:
+                if change_key != row['change_key']:
+                    changed.append(row)
+            # The DATETIME column is naive UTC and rounds to a few milliseconds, so compare whole seconds
+            elif last_modified.replace(microsecond=0) != row['last_modified'].astimezone(timezone.utc).replace(tzinfo=None, microsecond=0):
+                changed.append(row)
+        return changed
 
     def sync_calendar(self, start_date, end_date):
         """Sync calendar events for a user or all users within a date range.
@@ -290,33 +613,74 @@ class CalendarSync:
                 logger.error("No users found to process")
                 return
 
-            # Process each user's calendar
-            for user in users:
-                user_email = user.get('mail')
-                if not user_email:
-                    continue
+            # Process users in groups that fit into a single Graph $batch request,
+            # syncing several groups in parallel since the work is network bound
+            user_emails = [user['mail'] for user in users if user.get('mail')]
+            user_groups = [user_emails[i:i + GRAPH_BATCH_LIMIT] for i in range(0, len(user_emails), GRAPH_BATCH_LIMIT)]
+            with ThreadPoolExecutor(max_workers=SYNC_MAX_WORKERS) as executor:
+                list(executor.map(lambda group: self._sync_users(group, start_date, end_date), user_groups))
 
-                user_name = user.get('displayName', user_email)
-                logger.info(f"Processing calendar for user: {user_email}")
+        except Exception as e:
+            logger.error(f"Error in sync_calendar: {str(e)}")
+            raise
+        finally:
+            # Persist a token refreshed during the sync now rather than only at exit
+            self._token_backend.flush()
 
-                try:
-                    logger.info(f"Fetching calendar events for {user_email} from {start_date} to {end_date}")
+    def _sync_users(self, user_emails, start_date, end_date):
+        """Fetch and store calendar events for a group of users using batched Graph requests.
 
-                    # Get calendar events in batches
-                    events = self.get_calendar_events_batch(user_email, start_date, end_date)
-                    
-                    if events:
-                        self.process_events(events, user_email)
-                    else:
-                        logger.info(f"No events found for user {user_email} in the specified time range")
+        Each page of events is handed to a writer thread as soon as it arrives, so storing a page
+        overlaps with fetching the next one and a user's calendar is never held in memory as a
+        whole. Users whose previous sync covered the same date range only fetch the changes
+        since then.
+        """
+        failed_users = set()
+        pages = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
 
+        def store_pages():
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                user_email, events = page
+                try:
+                    if not self.process_events(events, user_email):
+                        failed_users.add(user_email)
                 except Exception as e:
-                    logger.error(f"Error processing calendar for user {user_email}: {str(e)}")
-                    continue
+                    logger.error(f"Error storing events for user {user_email}: {str(e)}")
+                    failed_users.add(user_email)
 
+        writer = threading.Thread(target=store_pages, name="event-writer", daemon=True)
+        writer.start()
+        try:
+            self.prefetch_user_timezones(user_emails)
+            delta_links = self.db.get_delta_links(user_emails, start_date, end_date, DELTA_RESYNC_DAYS)
+            events_by_user, new_delta_links = self.get_calendar_events_for_users(
+                user_emails, start_date, end_date, delta_links=delta_links,
+                on_page=lambda user_email, events: pages.put((user_email, events))
+            )
         except Exception as e:
-            logger.error(f"Error in sync_calendar: {str(e)}")
-            raise
+            logger.error(f"Error fetching calendars for users {', '.join(user_emails)}: {str(e)}")
+            return
+        finally:
+            # Let the writer store the queued pages before any delta link is saved
+            pages.put(None)
+            writer.join()
+
+        for user_email in user_emails:
+            # Only remember the delta link once all changes it covers are stored
+            if events_by_user.get(user_email) is None or user_email in failed_users:
+                continue
+            if user_email in new_delta_links:
+                try:
+                    # Users whose delta link expired were reset to a full sync during the fetch
+                    self.db.save_delta_link(
+                        user_email, new_delta_links[user_email], start_date, end_date,
+                        full_sync=user_email not in delta_links
+                    )
+                except Exception as e:
+                    logger.error(f"Error saving delta link for user {user_email}: {str(e)}")
 
     def get_events(self, start_date=None, end_date=None, category=None, user_email=None):
         """Retrieve events based on filters."""
@@ -341,17 +705,18 @@ class CalendarSync:
                 logger.error("Not authenticated with Office 365")
                 return None
 
-            batch_endpoint = "https://graph.microsoft.com/v1.0/$batch"
             # The requests parameter should be a list, not a dict with 'requests' key
             batch_payload = {"requests": requests} if isinstance(requests, list) else requests
 
-            # Log the request payload for debugging
-            logger.debug(f"Batch request payload: {batch_payload}")
+            # Log the request payload for debugging, without building its repr when debug is off
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Batch request payload: %s", batch_payload)
 
-            response = self.account.connection.post(batch_endpoint, json=batch_payload)
+            response = self._make_request_with_retry(GRAPH_BATCH_ENDPOINT, method='post', json=batch_payload)
             if response:
-                responses = response.json().get('responses', [])
-                logger.debug(f"Batch response: {responses}")
+                responses = _response_json(response).get('responses', [])
+                # Only log the size, a full dump of every page would flood the debug log
+                logger.debug("Batch response with %d items", len(responses))
                 return responses
             return None
 
@@ -359,33 +724,117 @@ class CalendarSync:
             logger.error(f"Batch request error: {str(e)}")
             return None
 
-    def get_users_batch(self, batch_size=20):
-        """Get all users with mailboxes using batch request."""
-        if not self.account.is_authenticated:
+    def _batch_get(self, urls, headers=None):
+        """GET several Graph resources through $batch requests of up to 20 requests each.
+
+        Sub-requests throttled with 429/503/504 are retried in a later batch, waiting for the
+        longest Retry-After reported by the throttled sub-responses, or backing off
+        exponentially when Graph does not send one.
+
+        Args:
+            urls (dict): Request id mapped to a URL relative to the Graph v1.0 root.
+            headers (dict, optional): Headers to send with every sub-request.
+
+        Returns:
+            dict: Request id mapped to its sub-response. Failed batches are left out.
+        """
+        results = {}
+        pending = list(urls.items())
+        retries = 0
+
+        while pending:
+            throttled = []
+            retry_after = 0
+            for i in range(0, len(pending), GRAPH_BATCH_LIMIT):
+                requests = []
+                for request_id, url in pending[i:i + GRAPH_BATCH_LIMIT]:
+                    request = {'id': request_id, 'method': 'GET', 'url': url}
+                    if headers:
+                        request['headers'] = headers
+                    requests.append(request)
+
+                responses = self._make_batch_request(requests)
+                if not responses:
+                    logger.error("No response from batch request - API error")
+                    continue
+
+                for response in responses:
+                    request_id = response.get('id')
+                    if response.get('status') in (429, 503, 504) and retries < self.max_retries:
+                        throttled.append((request_id, urls[request_id]))
+                        retry_after = max(retry_after, self._retry_delay(retries, (response.get('headers') or {}).get('Retry-After')))
+                    else:
+                        results[request_id] = response
+
+            pending = throttled
+            if pending:
+                retries += 1
+                logger.warning(f"{len(pending)} batched requests throttled. Waiting {retry_after:.1f} seconds before retry.")
+                time.sleep(retry_after)
+
+        return results
+
+    def prefetch_user_timezones(self, user_emails):
+        """Resolve the timezones of several users with batched mailboxSettings requests."""
+        uncached = [email for email in user_emails if email not in self._user_tz_cache]
+        if not uncached:
+            return
+
+        # Timezones rarely change, reuse the ones stored by earlier runs while they are fresh
+        try:
+            stored = self.db.get_user_timezones(uncached, USER_TIMEZONE_MAX_AGE_DAYS)
+        except Exception as e:
+            logger.warning(f"Could not load stored user timezones: {str(e)}")
+            stored = {}
+        self._user_tz_cache.update(stored)
+        uncached = [email for email in uncached if email not in stored]
+        if not uncached:
+            return
+
+        urls = {str(i): f"/users/{email}/mailboxSettings" for i, email in enumerate(uncached)}
+        responses = self._batch_get(urls)
+        resolved = {}
+        for request_id, user_email in enumerate(uncached):
+            response = responses.get(str(request_id))
+            if response and response.get('status') == 200:
+                windows_timezone = response.get('body', {}).get('timeZone')
+                logger.info(f"Retrieved timezone {windows_timezone} for user {user_email}")
+                resolved[user_email] = self._resolve_user_timezone(user_email, windows_timezone)
+            else:
+                logger.warning(f"Error getting timezone for user {user_email} in batch: {response}")
+
+        try:
+            self.db.save_user_timezones(resolved)
+        except Exception as e:
+            logger.warning(f"Could not store user timezones: {str(e)}")
+
+    def get_users_batch(self):
+        """Get all users with mailboxes, following the paged /users listing."""
+        if not self.authenticate():
             raise Exception("Not authenticated")
         
         try:
             all_users = []
             next_link = None
             
-            # Initial request URL
-            base_url = "https://graph.microsoft.com/v1.0/users?$select=id,displayName,mail,userPrincipalName&$top=999"
+            # Initial request URL, letting Graph skip users without a mailbox
+            base_url = GRAPH_USERS_URL
+            headers = {'ConsistencyLevel': 'eventual'}
             
             while True:
                 # Use next_link if available, otherwise use base_url
                 current_url = next_link if next_link else base_url
                 
                 # Make single request instead of batch for the main user list
-                response = self.account.connection.get(current_url)
-                if not response:
-                    logger.error("Failed to get users response")
-                    break
+                response = self._make_request_with_retry(current_url, headers=headers)
+                if response is None:
+                    # A partial user list would silently skip users, fail the whole listing instead
+                    raise Exception("Failed to get users response")
                 
-                response_data = response.json()
+                response_data = _response_json(response)
                 users = response_data.get('value', [])
-                filtered_users = [user for user in users if user.get('mail')]
-                logger.debug(f"Found {len(filtered_users)} users with mail in this page")
-                all_users.extend(filtered_users)
+                logger.debug("Found %d users with mail in this page", len(users))
+                all_users.extend(users)
                 
                 # Check for next page
                 next_link = response_data.get('@odata.nextLink')
@@ -399,7 +848,7 @@ class CalendarSync:
             logger.error(f"Error getting users: {str(e)}")
             raise
 
-    def get_calendar_events_batch(self, user_email, start_date, end_date, batch_size=20):
+    def get_calendar_events_batch(self, user_email, start_date, end_date, batch_size=EVENTS_PAGE_SIZE):
         """
         Get calendar events for a user using batch requests.
         
@@ -407,104 +856,137 @@ class CalendarSync:
             user_email (str): The email address of the user
             start_date (date): Start date for events (inclusive, starts at 00:00)
             end_date (date): End date for events (exclusive, ends at 00:00 the next day)
-            batch_size (int): Number of events to retrieve per batch request
+            batch_size (int): Number of events to retrieve per page
             
         Returns:
             list: List of calendar events, or None if there was an API error
         """
-        # Get user's timezone
-        user_tz = ZoneInfo(self.get_user_timezone(user_email))
-        
-        # Convert dates to datetime with explicit boundaries in user's timezone
-        start_time = datetime.combine(start_date, datetime.min.time(), tzinfo=user_tz)
-        end_time = datetime.combine(end_date + timedelta(days=1), datetime.min.time(), tzinfo=user_tz)
-        
-        # Convert times to UTC for the API request
-        start_time_utc = start_time.astimezone(timezone.utc)
-        end_time_utc = end_time.astimezone(timezone.utc)
-        
-        start_time_str = start_time_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        end_time_str = end_time_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        
-        logger.info(f"Fetching calendar events for {user_email} from {start_date} to {end_date}")
-        logger.debug(f"Using UTC time range: {start_time_utc} to {end_time_utc}")
-        logger.debug(f"User timezone: {user_tz}")
+        events_by_user, _ = self.get_calendar_events_for_users([user_email], start_date, end_date, batch_size)
+        return events_by_user.get(user_email)
 
-        select_fields = "id,subject,body,start,end,categories,extensions,importance,organizer,recurrence,reminderMinutesBeforeStart,responseRequested,responseStatus,sensitivity,showAs,type"
-        base_url = f"/users/{user_email}/calendar/calendarView?$select={select_fields}&startDateTime={start_time_str}&endDateTime={end_time_str}&$orderby=start/dateTime"
-        
-        all_events = []
-        skip = 0
-        has_more = True
-        
-        while has_more:
-            # Make a single request instead of a batch
-            request = {
-                'id': '1',
-                'method': 'GET',
-                'url': f"{base_url}&$skip={skip}&$top={batch_size}",
-                'headers': {
-                    'Accept': 'application/json',
-                    'Prefer': 'outlook.timezone="W. Europe Standard Time"'
-                }
-            }
-            
-            # Create proper batch payload with just one request
-            batch_payload = {'requests': [request]}
-            
-            # Make batch request
-            responses = self._make_batch_request(batch_payload)
-            logger.debug(f"Batch response: {responses}")
+    def get_calendar_events_for_users(self, user_emails, start_date, end_date, batch_size=EVENTS_PAGE_SIZE, delta_links=None,
+                                      on_page=None):
+        """
+        Get calendar events for several users through calendarView delta queries,
+        sharing $batch requests between them.
+
+        The first page of every user is requested in one batch; further pages are fetched
+        in follow-up batches for the users that returned a nextLink. Users with a delta link
+        from an earlier sync of the same range only receive the events changed since then;
+        deleted events are returned as entries with an '@removed' key.
+
+        Args:
+            user_emails (list): The email addresses of the users
+            start_date (date): Start date for events (inclusive, starts at 00:00)
+            end_date (date): End date for events (exclusive, ends at 00:00 the next day)
+            batch_size (int): Maximum number of events per page
+            delta_links (dict, optional): User email mapped to the delta link of an earlier sync.
+                Users whose link has expired are removed from it, as they get a full sync instead.
+            on_page (callable, optional): Called as on_page(user_email, events) for every page
+                as it arrives. The events are then passed on instead of collected.
+
+        Returns:
+            tuple: (events_by_user, delta_links) where events_by_user maps each user email to the
+                list of calendar events (empty when on_page is given), or None if there was an
+                API error, and delta_links maps each user email to the delta link to use for the
+                next sync.
+        """
+        delta_links = delta_links or {}
+        headers = {
+            'Accept': 'application/json',
+            # Have Graph return start/end in UTC, which is how _parse_date interprets them, and the
+            # body as plain text, which is much smaller than the HTML version. Delta queries do not
+            # support $select or $top, so the page size is set through odata.maxpagesize instead.
+            'Prefer': f'outlook.timezone="UTC", outlook.body-content-type="text", odata.maxpagesize={batch_size}'
+        }
+
+        events_by_user = {}
+        event_counts = {}
+        initial_urls = {}
+        pending = {}
+        for user_email in user_emails:
+            # Get user's timezone and the matching UTC query range, shared by users in the same timezone
+            user_tz = self.get_user_timezone(user_email)
+            start_time_str, end_time_str = _utc_query_range(start_date, end_date, user_tz)
             
-            if not responses:
-                logger.error("No response from batch request - API error")
-                return None  # Indicate an actual error occurred
+            logger.debug("Using UTC time range: %s to %s", start_time_str, end_time_str)
+            logger.debug("User timezone: %s", user_tz)
+
+            events_by_user[user_email] = []
+            event_counts[user_email] = 0
+            initial_urls[user_email] = CALENDAR_VIEW_DELTA_URL.format(
+                user_email=user_email, start=start_time_str, end=end_time_str
+            )
+            if user_email in delta_links:
+                logger.info(f"Fetching calendar changes for {user_email} from {start_date} to {end_date}")
+                pending[user_email] = self._relative_graph_url(delta_links[user_email])
+            else:
+                logger.info(f"Fetching calendar events for {user_email} from {start_date} to {end_date}")
+                pending[user_email] = initial_urls[user_email]
+
+        new_delta_links = {}
+        while pending:
+            request_emails = list(pending)
+            responses = self._batch_get({str(i): pending[email] for i, email in enumerate(request_emails)}, headers)
+            pending = {}
+
+            for request_id, user_email in enumerate(request_emails):
+                response = responses.get(str(request_id))
+                if response and response.get('status') == 410 and user_email in delta_links:
+                    # The delta token expired or the sync state was reset, start over with a full sync
+                    logger.warning(f"Delta link for user {user_email} is no longer valid, falling back to full sync")
+                    del delta_links[user_email]
+                    events_by_user[user_email] = []
+                    event_counts[user_email] = 0
+                    pending[user_email] = initial_urls[user_email]
+                    continue
 
-            try:
-                events_in_batch = []
-                response = responses[0]  # Only one response since we only made one request
-                if response.get('status') == 200:
-                    events = response.get('body', {}).get('value', [])
-                    if events:
-                        events_in_batch.extend(events)
-                        logger.debug(f"Added {len(events)} events from response")
-                else:
-                    logger.error(f"Error in batch response: {response}")
-                    return None  # Indicate an actual error occurred
-                    
-                if not events_in_batch:
-                    if skip == 0:
-                        logger.info(f"No calendar events found for {user_email} in the specified time range")
-                    else:
-                        logger.debug("No more events to retrieve")
-                    has_more = False
+                if response and response.get('status') == 404:
+                    # Users without a mailbox (no Exchange license) have no calendar to sync
+                    logger.info(f"No calendar available for user {user_email} - skipping")
+                    events_by_user[user_email] = None
+                    continue
+
+                if not response or response.get('status') != 200:
+                    logger.error(f"Error in batch response for user {user_email}: {response}")
+                    events_by_user[user_email] = None  # Indicate an actual error occurred
+                    continue
+
+                body = response.get('body', {})
+                events = body.get('value', [])
+                event_counts[user_email] += len(events)
+                if on_page:
+                    on_page(user_email, events)
                 else:
-                    all_events.extend(events_in_batch)
-                    skip += batch_size
-                    logger.info(f"Retrieved {len(events_in_batch)} events in current batch")
-                    
-                    # Add a small delay between batches to reduce database load
-                    time.sleep(0.5)
-                    
-            except Exception as e:
-                logger.error(f"Error processing batch response: {str(e)}")
-                return None  # Indicate an actual error occurred
+                    events_by_user[user_email].extend(events)
+                logger.debug("Retrieved %d events in current batch for user %s", len(events), user_email)
+
+                next_link = body.get('@odata.nextLink')
+                if next_link:
+                    pending[user_email] = self._relative_graph_url(next_link)
+                elif body.get('@odata.deltaLink'):
+                    new_delta_links[user_email] = body['@odata.deltaLink']
+
+        for user_email, events in events_by_user.items():
+            if events is None:
+                continue
+            if event_counts[user_email]:
+                logger.info(f"Retrieved total of {event_counts[user_email]} events for user {user_email}")
+            else:
+                logger.info(f"No events found for user {user_email} in the specified time range")
+        return events_by_user, new_delta_links
 
-        total_events = len(all_events)
-        if total_events == 0:
-            logger.info(f"No events found for user {user_email} in the specified time range")
-        else:
-            logger.info(f"Retrieved total of {total_events} events for user {user_email}")
-        return all_events 
+    @staticmethod
+    def _relative_graph_url(url):
+        """Strip the Graph v1.0 root from an absolute URL so it can be used inside $batch."""
+        return url[len(GRAPH_ENDPOINT):] if url.startswith(GRAPH_ENDPOINT) else url
 
     def _parse_date(self, date_str):
         """Parse date string from the API into a datetime object."""
         if not date_str:
             return None
         try:
-            # Remove the trailing Z if present and parse
-            date_str = date_str.rstrip('Z')
-            return datetime.fromisoformat(date_str).replace(tzinfo=timezone.utc)
+            return _parse_graph_datetime(date_str)
         except (ValueError, TypeError) as e:
             logger.error(f"Error parsing date {date_str}: {str(e)}")
             return None 
\ No newline at end of file
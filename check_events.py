@@ -15,9 +15,8 @@ def main():
     print("-" * 80)
     
     for event in events:
-        # Get categories for the event
-        categories = db.get_event_categories(event['event_id'])
-        category_str = ", ".join(cat['name'] for cat in categories) if categories else "No categories"
+        # Category names come with the events, no query per event
+        category_str = ", ".join(event['categories']) if event['categories'] else "No categories"
         
         print(f"Event: {event['subject']}")
         print(f"User: {event['user_email']}")
@@ -15,11 +15,22 @@ DB_SERVER = os.getenv('DB_SERVER')
 DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
+DB_POOL_SIZE = max(1, int(os.getenv('DB_POOL_SIZE', '5')))  # Pooled connections per DatabaseManager
 
 # Application Settings
-LOG_LEVEL = 'DEBUG'
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 SYNC_INTERVAL_MINUTES = int(os.getenv('SYNC_INTERVAL_MINUTES', '15'))
 LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', '7'))
+# Delta links are only reused for the exact date range they were created for. main.py centres
+# the window on today, so in practice each day starts with a full sync and this only caps the
+# time since the last full sync for fixed ranges
+DELTA_RESYNC_DAYS = int(os.getenv('DELTA_RESYNC_DAYS', '7'))
+SYNC_MAX_WORKERS = max(1, int(os.getenv('SYNC_MAX_WORKERS', '4')))  # ThreadPoolExecutor needs at least one worker
+WINDOWS_ZONES_MAX_AGE_DAYS = int(os.getenv('WINDOWS_ZONES_MAX_AGE_DAYS', '30'))
+USER_TIMEZONE_MAX_AGE_DAYS = int(os.getenv('USER_TIMEZONE_MAX_AGE_DAYS', '7'))
+
+# Parsed Unicode CLDR Windows->IANA timezone mapping, written by update_windows_zones.py
+WINDOWS_ZONES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'windowsZones.json')
 
 # Configure logging
 def setup_logging():
@@ -55,6 +66,9 @@ def setup_logging():
     
     logger.addHandler(file_handler)
     logger.addHandler(console_handler)
+
+    # Keep records away from any root handlers, which would write every line a second time
+    logger.propagate = False
     
     return logger
 
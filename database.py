@@ -1,5 +1,5 @@
 import pyodbc
-from config import DB_SERVER, DB_NAME, DB_USER, DB_PASSWORD, logger
+from config import DB_SERVER, DB_NAME, DB_USER, DB_PASSWORD, DB_POOL_SIZE, logger
 import os
 from datetime import timezone
 from contextlib import contextmanager
@@ -7,8 +7,12 @@ from queue import Queue
 from threading import Lock
 import time
 
+# SQL Server allows at most 2100 parameters per statement and 1000 rows per VALUES list
+MAX_ROWS_PER_INSERT = 1000
+CATEGORY_NAME_SEPARATOR = '\x1f'  # NCHAR(31), joins category names in event queries
+
 class DatabaseManager:
-    def __init__(self, pool_size=5):
+    def __init__(self, pool_size=DB_POOL_SIZE):
         self.connection_string = (
             f"DRIVER={{ODBC Driver 18 for SQL Server}};"
             f"SERVER={DB_SERVER};"
@@ -29,14 +33,18 @@ class DatabaseManager:
         self.connection_pool = Queue(maxsize=self.pool_size)
         for _ in range(self.pool_size):
             try:
-                conn = pyodbc.connect(self.connection_string, timeout=30)  # 30 second connection timeout
-                conn.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
-                conn.execute("SET LOCK_TIMEOUT 5000")  # 5 second lock timeout
-                self.connection_pool.put(conn)
+                self.connection_pool.put(self._create_connection())
             except Exception as e:
                 logger.error(f"Error initializing connection pool: {str(e)}")
                 raise
 
+    def _create_connection(self):
+        """Open a connection with the session settings every pooled connection shares."""
+        conn = pyodbc.connect(self.connection_string, timeout=30)  # 30 second connection timeout
+        conn.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+        conn.execute("SET LOCK_TIMEOUT 5000")  # 5 second lock timeout
+        return conn
+
     @contextmanager
     def get_connection(self):
         """Get a connection from the pool with context management."""
@@ -60,74 +68,20 @@ class DatabaseManager:
                     self.connection_pool.put(connection)
                 except Exception as e:
                     logger.error(f"Error returning connection to pool: {str(e)}")
-                    # If we can't return it to the pool, try to create a new one
+                    # The connection is broken, close it and put a new one in its place
                     try:
-                        new_conn = pyodbc.connect(self.connection_string)
-                        new_conn.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
-                        self.connection_pool.put(new_conn)
+                        connection.close()
                     except:
-                        logger.error("Failed to create replacement connection")
-
-    def get_or_create_categories(self, category_names):
-        """Get or create multiple categories in a single transaction."""
-        try:
-            with self.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("BEGIN TRANSACTION")
+                        pass
                     try:
-                        # Sort category names to ensure consistent lock ordering
-                        sorted_names = sorted(category_names)
-                        values = []
-                        params = []
-                        for name in sorted_names:
-                            values.append("(?)")
-                            params.append(name)
-
-                        # Single query to get existing categories and insert missing ones
-                        query = f"""
-                        WITH existing_categories AS (
-                            SELECT category_id, name 
-                            FROM calendar_category WITH (UPDLOCK, HOLDLOCK)
-                            WHERE name IN ({','.join(['?' for _ in sorted_names])})
-                        ),
-                        new_categories AS (
-                            INSERT INTO calendar_category (name)
-                            OUTPUT 
-                                INSERTED.category_id,
-                                INSERTED.name
-                            SELECT n.name
-                            FROM (
-                                VALUES {','.join(values)}
-                            ) n(name)
-                            WHERE NOT EXISTS (
-                                SELECT 1 FROM existing_categories e 
-                                WHERE e.name = n.name
-                            )
-                        )
-                        SELECT category_id, name FROM existing_categories
-                        UNION ALL
-                        SELECT category_id, name FROM new_categories
-                        ORDER BY name;
-                        """
-                        
-                        cursor.execute(query, params + params)  # params twice: once for EXISTS check, once for VALUES
-                        
-                        # Store categories - name as key, id as value
-                        category_ids = {row[1]: row[0] for row in cursor.fetchall()}  # row[0] is id, row[1] is name
-
-                        conn.commit()
-                        return category_ids
-                    except Exception:
-                        conn.rollback()
-                        raise
-        except Exception as e:
-            logger.error(f"Database error while getting/creating categories: {str(e)}")
-            raise
+                        self.connection_pool.put(self._create_connection())
+                    except:
+                        logger.error("Failed to create replacement connection")
 
     def upsert_events_batch(self, events):
         """Insert or update multiple calendar events and their categories in a single transaction."""
         try:
-            logger.debug(f"Processing batch upsert of {len(events)} events")
+            logger.debug("Processing batch upsert of %d events", len(events))
 
             with self.get_connection() as conn:
                 with conn.cursor() as cursor:
@@ -145,7 +99,8 @@ class DatabaseManager:
                                 start_date DATETIME NOT NULL,
                                 end_date DATETIME NOT NULL,
                                 last_modified DATETIME NOT NULL,
-                                is_deleted BIT NOT NULL
+                                is_deleted BIT NOT NULL,
+                                change_key NVARCHAR(255)
                             );
 
                             CREATE TABLE #temp_categories (
@@ -159,59 +114,57 @@ class DatabaseManager:
                             );
                         """)
 
+                        # Send each temp table's rows as one parameter array instead of one round trip per row
+                        cursor.fast_executemany = True
+
                         # Insert into temp_events
-                        event_values = []
-                        event_params = []
-                        for event in events:
-                            event_values.append("(?, ?, ?, ?, ?, ?, ?, ?, ?)")
-                            event_params.extend([
-                                event['event_id'],
-                                event['user_email'],
-                                event['user_name'],
-                                event['subject'],
-                                event['description'],
-                                event['start_date'],
-                                event['end_date'],
-                                event['last_modified'],
-                                event['is_deleted']
+                        if events:
+                            cursor.executemany("""
+                                INSERT INTO #temp_events
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """, [
+                                (
+                                    event['event_id'],
+                                    event['user_email'],
+                                    event['user_name'],
+                                    event['subject'],
+                                    event['description'],
+                                    event['start_date'],
+                                    event['end_date'],
+                                    event['last_modified'],
+                                    event['is_deleted'],
+                                    event.get('change_key')
+                                )
+                                for event in events
                             ])
 
-                        if event_values:
-                            cursor.execute(f"""
-                                INSERT INTO #temp_events 
-                                VALUES {','.join(event_values)}
-                            """, event_params)
-
-                        # Insert into temp_categories and temp_event_categories
-                        category_values = []
-                        category_params = []
-                        event_category_values = []
-                        event_category_params = []
-
+                        # Insert into temp_categories and temp_event_categories, without duplicates
+                        # as both tables have a primary key over all of their columns. The server
+                        # compares names case-insensitively and ignores trailing spaces, so "Work"
+                        # and "work " are one category; keep the first spelling seen
+                        categories = {}
+                        event_categories = {}
                         for event in events:
-                            if 'categories' in event and event['categories']:
-                                for category in event['categories']:
-                                    category_values.append("(?)")
-                                    category_params.append(category)
-                                    event_category_values.append("(?, ?)")
-                                    event_category_params.extend([event['event_id'], category])
-
-                        if category_values:
-                            cursor.execute(f"""
-                                INSERT INTO #temp_categories 
-                                SELECT DISTINCT t.name
-                                FROM (VALUES {','.join(category_values)}) AS t(name)
-                            """, category_params)
-
-                        if event_category_values:
-                            cursor.execute(f"""
-                                INSERT INTO #temp_event_categories 
-                                VALUES {','.join(event_category_values)}
-                            """, event_category_params)
-
-                        # Merge events
+                            for category in event.get('categories') or []:
+                                key = category.rstrip(' ').casefold()
+                                name = categories.setdefault(key, category)
+                                event_categories.setdefault((event['event_id'], key), (event['event_id'], name))
+                        category_params = sorted(categories.values())
+                        event_category_params = list(event_categories.values())
+
+                        if category_params:
+                            cursor.executemany(
+                                "INSERT INTO #temp_categories VALUES (?)",
+                                [(category,) for category in category_params]
+                            )
+                            cursor.executemany(
+                                "INSERT INTO #temp_event_categories VALUES (?, ?)",
+                                event_category_params
+                            )
+
+                        # Merge events, HOLDLOCK keeps concurrent workers from inserting the same key twice
                         cursor.execute("""
-                            MERGE calendar_event AS target
+                            MERGE calendar_event WITH (HOLDLOCK) AS target
                             USING #temp_events AS source
                             ON target.event_id = source.event_id
                             WHEN MATCHED THEN
@@ -224,28 +177,31 @@ class DatabaseManager:
                                     end_date = source.end_date,
                                     last_modified = source.last_modified,
                                     is_deleted = source.is_deleted,
+                                    change_key = source.change_key,
                                     updated_at = GETDATE()
                             WHEN NOT MATCHED THEN
                                 INSERT (
                                     event_id, user_email, user_name, subject, description,
-                                    start_date, end_date, last_modified, is_deleted
+                                    start_date, end_date, last_modified, is_deleted, change_key
                                 )
                                 VALUES (
                                     source.event_id, source.user_email, source.user_name,
                                     source.subject, source.description, source.start_date,
-                                    source.end_date, source.last_modified, source.is_deleted
+                                    source.end_date, source.last_modified, source.is_deleted,
+                                    source.change_key
                                 );
                         """)
 
-                        # Merge categories
-                        cursor.execute("""
-                            MERGE calendar_category AS target
-                            USING #temp_categories AS source
-                            ON target.name = source.name
-                            WHEN NOT MATCHED THEN
-                                INSERT (name)
-                                VALUES (source.name);
-                        """)
+                        # Merge categories, a batch without any categories has nothing to merge
+                        if category_params:
+                            cursor.execute("""
+                                MERGE calendar_category WITH (HOLDLOCK) AS target
+                                USING #temp_categories AS source
+                                ON target.name = source.name
+                                WHEN NOT MATCHED THEN
+                                    INSERT (name)
+                                    VALUES (source.name);
+                            """)
 
                         # Update event-category relationships
                         cursor.execute("""
@@ -260,22 +216,25 @@ class DatabaseManager:
                                 WHERE tec.event_id = ec.event_id 
                                 AND cc.category_id = ec.category_id
                             );
-
-                            -- Then insert new relationships
-                            INSERT INTO calendar_event_calendar_category (event_id, category_id)
-                            SELECT DISTINCT tec.event_id, cc.category_id
-                            FROM #temp_event_categories tec
-                            INNER JOIN calendar_category cc ON cc.name = tec.category_name
-                            WHERE NOT EXISTS (
-                                SELECT 1 
-                                FROM calendar_event_calendar_category ec
-                                WHERE ec.event_id = tec.event_id 
-                                AND ec.category_id = cc.category_id
-                            );
                         """)
 
+                        # Then insert new relationships
+                        if category_params:
+                            cursor.execute("""
+                                INSERT INTO calendar_event_calendar_category (event_id, category_id)
+                                SELECT DISTINCT tec.event_id, cc.category_id
+                                FROM #temp_event_categories tec
+                                INNER JOIN calendar_category cc ON cc.name = tec.category_name
+                                WHERE NOT EXISTS (
+                                    SELECT 1 
+                                    FROM calendar_event_calendar_category ec
+                                    WHERE ec.event_id = tec.event_id 
+                                    AND ec.category_id = cc.category_id
+                                );
+                            """)
+
                         conn.commit()
-                        logger.debug(f"Successfully upserted {len(events)} events")
+                        logger.debug("Successfully upserted %d events", len(events))
                         return True
 
                     except Exception as e:
@@ -319,11 +278,18 @@ class DatabaseManager:
                             end_date DATETIME NOT NULL,
                             last_modified DATETIME NOT NULL,
                             is_deleted BIT NOT NULL DEFAULT 0,
+                            change_key NVARCHAR(255),
                             created_at DATETIME NOT NULL DEFAULT GETDATE(),
                             updated_at DATETIME NOT NULL DEFAULT GETDATE()
                         )
                     """)
 
+                    # Add the Graph changeKey column to tables created before it existed
+                    cursor.execute("""
+                        IF COL_LENGTH('calendar_event', 'change_key') IS NULL
+                        ALTER TABLE calendar_event ADD change_key NVARCHAR(255)
+                    """)
+
                     # Create calendar_category table if it doesn't exist
                     cursor.execute("""
                         IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='calendar_category' and xtype='U')
@@ -358,6 +324,37 @@ class DatabaseManager:
                         END
                     """)
 
+                    # Create calendar_sync_state table if it doesn't exist
+                    cursor.execute("""
+                        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='calendar_sync_state' and xtype='U')
+                        CREATE TABLE calendar_sync_state (
+                            user_email NVARCHAR(255) PRIMARY KEY,
+                            delta_link NVARCHAR(MAX) NOT NULL,
+                            start_date DATE NOT NULL,
+                            end_date DATE NOT NULL,
+                            full_sync_at DATETIME NOT NULL DEFAULT GETDATE(),
+                            created_at DATETIME NOT NULL DEFAULT GETDATE(),
+                            updated_at DATETIME NOT NULL DEFAULT GETDATE()
+                        )
+                    """)
+
+                    # Add the last full sync time to tables created before it existed
+                    cursor.execute("""
+                        IF COL_LENGTH('calendar_sync_state', 'full_sync_at') IS NULL
+                        ALTER TABLE calendar_sync_state ADD full_sync_at DATETIME NOT NULL DEFAULT GETDATE()
+                    """)
+
+                    # Create calendar_user_timezone table if it doesn't exist
+                    cursor.execute("""
+                        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='calendar_user_timezone' and xtype='U')
+                        CREATE TABLE calendar_user_timezone (
+                            user_email NVARCHAR(255) PRIMARY KEY,
+                            time_zone NVARCHAR(100) NOT NULL,
+                            created_at DATETIME NOT NULL DEFAULT GETDATE(),
+                            updated_at DATETIME NOT NULL DEFAULT GETDATE()
+                        )
+                    """)
+
                     # If not exists (SELECT * FROM sys.indexes WHERE name = 'IX_calendar_event_event_id' AND object_id = OBJECT_ID('calendar_event'))
                     # BEGIN
                     #     CREATE NONCLUSTERED INDEX IX_calendar_event_event_id ON calendar_event(event_id);
@@ -375,6 +372,8 @@ class DatabaseManager:
             with conn.cursor() as cursor:
                 logger.info("Dropping tables...")
                 cursor.execute("""
+                    DROP TABLE IF EXISTS [dbo].[calendar_user_timezone];
+                    DROP TABLE IF EXISTS [dbo].[calendar_sync_state];
                     DROP TABLE IF EXISTS [dbo].[calendar_event_calendar_category];
                     DROP TABLE IF EXISTS [dbo].[calendar_category];
                     DROP TABLE IF EXISTS [dbo].[calendar_event];
@@ -391,46 +390,87 @@ class DatabaseManager:
             except:
                 pass 
 
-    def get_events_by_date_range(self, start_date, end_date):
-        """Get all events within a date range."""
+    def _get_events(self, condition, params):
+        """Get the events matching a WHERE condition, with the names of their categories.
+
+        Categories are aggregated in the same query, so listing events costs one round trip
+        instead of one extra query per event.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT 
+                        e.event_id,
+                        e.user_email,
+                        e.user_name,
+                        e.subject,
+                        e.description,
+                        e.start_date,
+                        e.end_date,
+                        e.last_modified,
+                        e.is_deleted,
+                        cat.names
+                    FROM calendar_event e WITH (NOLOCK)
+                    OUTER APPLY (
+                        SELECT STRING_AGG(CAST(c.name AS NVARCHAR(MAX)), NCHAR(31))
+                            WITHIN GROUP (ORDER BY c.name) AS names
+                        FROM calendar_event_calendar_category ec WITH (NOLOCK)
+                        JOIN calendar_category c WITH (NOLOCK) ON c.category_id = ec.category_id
+                        WHERE ec.event_id = e.event_id
+                    ) cat
+                    WHERE {condition}
+                    ORDER BY e.start_date
+                """, params)
+
+                events = []
+                for row in cursor.fetchall():
+                    events.append({
+                        'event_id': row[0],
+                        'user_email': row[1],
+                        'user_name': row[2],
+                        'subject': row[3],
+                        'description': row[4],
+                        'start_date': row[5],
+                        'end_date': row[6],
+                        'last_modified': row[7],
+                        'is_deleted': row[8],
+                        # Names are joined with the ASCII unit separator, a control character names never contain
+                        'categories': row[9].split(CATEGORY_NAME_SEPARATOR) if row[9] else []
+                    })
+
+                return events
+
+    def get_events_by_date_range(self, start_date, end_date, user_email=None):
+        """Get all events within a date range, optionally for a single user."""
         try:
-            with self.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        SELECT 
-                            event_id,
-                            user_email,
-                            user_name,
-                            subject,
-                            description,
-                            start_date,
-                            end_date,
-                            last_modified,
-                            is_deleted
-                        FROM calendar_event WITH (NOLOCK)
-                        WHERE start_date >= ? AND end_date <= ?
-                        ORDER BY start_date
-                    """, [start_date, end_date])
-                    
-                    events = []
-                    for row in cursor.fetchall():
-                        events.append({
-                            'event_id': row[0],
-                            'user_email': row[1],
-                            'user_name': row[2],
-                            'subject': row[3],
-                            'description': row[4],
-                            'start_date': row[5],
-                            'end_date': row[6],
-                            'last_modified': row[7],
-                            'is_deleted': row[8]
-                        })
-                    
-                    return events
+            condition = "e.start_date >= ? AND e.end_date <= ?"
+            params = [start_date, end_date]
+            if user_email:
+                condition += " AND e.user_email = ?"
+                params.append(user_email)
+            return self._get_events(condition, params)
         except Exception as e:
             logger.error(f"Database error while getting events by date range: {str(e)}")
             raise
 
+    def get_events_by_category(self, category, user_email=None):
+        """Get all events linked to a category, optionally for a single user."""
+        try:
+            condition = """EXISTS (
+                        SELECT 1
+                        FROM calendar_event_calendar_category ec WITH (NOLOCK)
+                        JOIN calendar_category c WITH (NOLOCK) ON c.category_id = ec.category_id
+                        WHERE ec.event_id = e.event_id AND c.name = ?
+                    )"""
+            params = [category]
+            if user_email:
+                condition += " AND e.user_email = ?"
+                params.append(user_email)
+            return self._get_events(condition, params)
+        except Exception as e:
+            logger.error(f"Database error while getting events by category: {str(e)}")
+            raise
+
     def get_event_categories(self, event_id):
         """Get all categories for a specific event."""
         try:
@@ -447,4 +487,148 @@ class DatabaseManager:
                     return [{'id': row[0], 'name': row[1]} for row in cursor.fetchall()]
         except Exception as e:
             logger.error(f"Database error while getting event categories: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    def mark_events_deleted(self, event_ids):
+        """Mark multiple events as deleted."""
+        if not event_ids:
+            return
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    # Stay well below the 2100 parameter limit of SQL Server
+                    for i in range(0, len(event_ids), 1000):
+                        chunk = event_ids[i:i + 1000]
+                        cursor.execute(f"""
+                            UPDATE calendar_event
+                            SET is_deleted = 1, updated_at = GETDATE()
+                            WHERE event_id IN ({','.join(['?' for _ in chunk])})
+                        """, chunk)
+                    conn.commit()
+                    logger.debug("Marked %d events as deleted", len(event_ids))
+        except Exception as e:
+            logger.error(f"Database error while marking events deleted: {str(e)}")
+            raise
+
+    def get_event_versions(self, event_ids):
+        """Get the stored (last_modified, change_key) of the given events that are not deleted."""
+        if not event_ids:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    versions = {}
+                    # Stay well below the 2100 parameter limit of SQL Server
+                    for i in range(0, len(event_ids), 1000):
+                        chunk = event_ids[i:i + 1000]
+                        cursor.execute(f"""
+                            SELECT event_id, last_modified, change_key
+                            FROM calendar_event WITH (NOLOCK)
+                            WHERE event_id IN ({','.join(['?' for _ in chunk])})
+                            AND is_deleted = 0
+                        """, chunk)
+                        versions.update((row[0], (row[1], row[2])) for row in cursor.fetchall())
+                    return versions
+        except Exception as e:
+            logger.error(f"Database error while getting event versions: {str(e)}")
+            raise
+
+    def get_delta_links(self, user_emails, start_date, end_date, max_age_days):
+        """Get the stored delta links of users whose last sync covered the same date range.
+
+        Links whose last full sync is older than max_age_days are ignored, so those users get a
+        periodic full sync even when they sync incrementally in between.
+        """
+        if not user_emails:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT user_email, delta_link
+                        FROM calendar_sync_state WITH (NOLOCK)
+                        WHERE user_email IN ({','.join(['?' for _ in user_emails])})
+                        AND start_date = ? AND end_date = ?
+                        AND full_sync_at >= DATEADD(day, -?, GETDATE())
+                    """, list(user_emails) + [start_date, end_date, max_age_days])
+
+                    return {row[0]: row[1] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Database error while getting delta links: {str(e)}")
+            raise
+
+    def save_delta_link(self, user_email, delta_link, start_date, end_date, full_sync):
+        """Store the delta link returned by the last completed sync of a user.
+
+        full_sync tells whether the link came from a full sync, which restarts the age
+        that get_delta_links checks; incremental syncs keep the previous full sync time.
+        """
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        MERGE calendar_sync_state AS target
+                        USING (SELECT ? AS user_email, ? AS delta_link, ? AS start_date, ? AS end_date, ? AS full_sync) AS source
+                        ON target.user_email = source.user_email
+                        WHEN MATCHED THEN
+                            UPDATE SET
+                                delta_link = source.delta_link,
+                                start_date = source.start_date,
+                                end_date = source.end_date,
+                                full_sync_at = CASE WHEN source.full_sync = 1 THEN GETDATE() ELSE target.full_sync_at END,
+                                updated_at = GETDATE()
+                        WHEN NOT MATCHED THEN
+                            INSERT (user_email, delta_link, start_date, end_date)
+                            VALUES (source.user_email, source.delta_link, source.start_date, source.end_date);
+                    """, [user_email, delta_link, start_date, end_date, full_sync])
+                    conn.commit()
+        except Exception as e:
+            logger.error(f"Database error while saving delta link: {str(e)}")
+            raise
+
+    def get_user_timezones(self, user_emails, max_age_days):
+        """Get the stored IANA timezones of users that were resolved within max_age_days."""
+        if not user_emails:
+            return {}
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"""
+                        SELECT user_email, time_zone
+                        FROM calendar_user_timezone WITH (NOLOCK)
+                        WHERE user_email IN ({','.join(['?' for _ in user_emails])})
+                        AND updated_at >= DATEADD(day, -?, GETDATE())
+                    """, list(user_emails) + [max_age_days])
+
+                    return {row[0]: row[1] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"Database error while getting user timezones: {str(e)}")
+            raise
+
+    def save_user_timezones(self, user_timezones):
+        """Store the resolved IANA timezone of several users."""
+        if not user_timezones:
+            return
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    items = list(user_timezones.items())
+                    # Two parameters per row, stay well below the 2100 parameter limit of SQL Server
+                    for i in range(0, len(items), MAX_ROWS_PER_INSERT):
+                        chunk = items[i:i + MAX_ROWS_PER_INSERT]
+                        cursor.execute(f"""
+                            MERGE calendar_user_timezone AS target
+                            USING (VALUES {','.join(['(?, ?)' for _ in chunk])}) AS source(user_email, time_zone)
+                            ON target.user_email = source.user_email
+                            WHEN MATCHED THEN
+                                UPDATE SET
+                                    time_zone = source.time_zone,
+                                    updated_at = GETDATE()
+                            WHEN NOT MATCHED THEN
+                                INSERT (user_email, time_zone)
+                                VALUES (source.user_email, source.time_zone);
+                        """, [value for item in chunk for value in item])
+                    conn.commit()
+        except Exception as e:
+            logger.error(f"Database error while saving user timezones: {str(e)}")
+            raise
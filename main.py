@@ -3,7 +3,8 @@ import time
 import argparse
 from datetime import datetime, date, timedelta
 from calendar_sync import CalendarSync
-from config import SYNC_INTERVAL_MINUTES, logger
+from config import SYNC_INTERVAL_MINUTES, WINDOWS_ZONES_MAX_AGE_DAYS, logger
+from update_windows_zones import update_windows_zones
 
 def sync_job(base_date=None):
     """Run the calendar sync job.
@@ -14,7 +15,8 @@ def sync_job(base_date=None):
     """
     try:
         sync = CalendarSync()
-        # If base_date is provided, use it as center, otherwise use current date
+        # If base_date is provided, use it as center, otherwise use current date.
+        # Delta links only match the exact range, so the first sync after the window moves is a full sync
         center_date = base_date or date.today()
         start_date = center_date - timedelta(days=90)
         end_date = center_date + timedelta(days=90)
@@ -24,6 +26,15 @@ def sync_job(base_date=None):
     except Exception as e:
         logger.error(f"Sync job failed: {str(e)}")
 
+def refresh_windows_zones():
+    """Refresh the stored CLDR timezone mapping once it is older than WINDOWS_ZONES_MAX_AGE_DAYS."""
+    try:
+        if update_windows_zones(max_age_days=WINDOWS_ZONES_MAX_AGE_DAYS):
+            CalendarSync.reload_windows_zones()
+    except Exception as e:
+        # tzlocal's bundled table still covers the common Windows timezones
+        logger.warning(f"Could not refresh CLDR timezone mapping: {str(e)}")
+
 def parse_date(date_str):
     """Parse date string in YYYY-MM-DD format."""
     try:
@@ -42,6 +53,8 @@ def main():
     )
     
     args = parser.parse_args()
+
+    refresh_windows_zones()
     
     if args.date:
         # If date is provided, do a single sync and exit
@@ -58,6 +71,7 @@ def main():
     
     # Schedule periodic sync
     schedule.every(SYNC_INTERVAL_MINUTES).minutes.do(sync_job)
+    schedule.every().day.do(refresh_windows_zones)
     
     logger.info(f"Scheduled sync job to run every {SYNC_INTERVAL_MINUTES} minutes")
     
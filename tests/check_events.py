@@ -58,9 +58,8 @@ def main():
                 logger.info(f"Local Time (Europe/Amsterdam): {local_start.strftime('%Y-%m-%d %H:%M')} to {local_end.strftime('%Y-%m-%d %H:%M')}")
                 logger.info(f"UTC: {event['start_date'].strftime('%Y-%m-%d %H:%M')} to {event['end_date'].strftime('%Y-%m-%d %H:%M')}")
                 
-                # Get categories for the event
-                categories = db.get_event_categories(event['event_id'])
-                category_names = [cat['name'] for cat in categories]
+                # Category names come with the events, no query per event
+                category_names = event['categories']
                 logger.info(f"Categories: {', '.join(category_names) if category_names else 'None'}")
                 logger.info(f"User: {event['user_name']} ({event['user_email']})")
                 if event['description']:
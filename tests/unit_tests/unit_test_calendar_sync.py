@@ -1,7 +1,10 @@
+import os
+import time
 import pytest
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from unittest.mock import Mock, patch, MagicMock, call
-from calendar_sync import CalendarSync
+from calendar_sync import CalendarSync, InMemoryTokenBackend, _load_windows_zones, _parse_graph_datetime
+from update_windows_zones import parse_windows_zones, update_windows_zones
 from database import DatabaseManager
 from O365 import Account, MSGraphProtocol
 
@@ -45,6 +48,17 @@ def calendar_sync(mock_db):
         sync = CalendarSync()
         return sync
 
+def graph_event(event_id, change_key=None, last_modified='2024-01-01T08:00:00Z'):
+    """Build a calendar event as returned by the Graph calendarView."""
+    return {
+        'id': event_id,
+        'changeKey': change_key,
+        'subject': 'Test Event',
+        'start': {'dateTime': '2024-01-01T09:00:00.0000000'},
+        'end': {'dateTime': '2024-01-01T10:00:00.0000000'},
+        'lastModifiedDateTime': last_modified,
+    }
+
 def test_authenticate_success(calendar_sync):
     """Test successful authentication."""
     with patch('calendar_sync.Account', autospec=True) as mock_account_class:
@@ -92,6 +106,16 @@ def test_already_authenticated(calendar_sync):
         assert result is True
         mock_account_instance.authenticate.assert_not_called()
 
+def test_authenticate_only_once(calendar_sync):
+    """Test that repeated authenticate calls reuse the first successful authentication."""
+    mock_account_instance = Mock()
+    type(mock_account_instance).is_authenticated = property(lambda self: False)
+    mock_account_instance.authenticate.return_value = True
+    calendar_sync.account = mock_account_instance
+    assert calendar_sync.authenticate() is True
+    assert calendar_sync.authenticate() is True
+    mock_account_instance.authenticate.assert_called_once_with(scopes=['https://graph.microsoft.com/.default'])
+
 def test_mark_event_deleted(calendar_sync):
     """Test marking an event as deleted."""
     event_id = "test_event_1"
@@ -117,7 +141,7 @@ def test_get_events_by_category_empty_result(calendar_sync):
 
 def test_get_users_success(calendar_sync):
     """Test successful retrieval of users."""
-    mock_response = Mock()
+    mock_response = Mock(status_code=200)
     mock_response.json.return_value = {
         'value': [
             {'mail': 'user1@example.com', 'displayName': 'User 1', 'id': '1'},
@@ -136,7 +160,7 @@ def test_get_users_success(calendar_sync):
 
 def test_get_users_empty_response(calendar_sync):
     """Test user retrieval with empty response."""
-    mock_response = Mock()
+    mock_response = Mock(status_code=200)
     mock_response.json.return_value = {'value': []}
     
     # Mock authentication state
@@ -155,7 +179,7 @@ def test_get_users_error(calendar_sync):
     with patch.object(calendar_sync.account.connection, 'get', side_effect=Exception("API Error")):
         with pytest.raises(Exception) as exc_info:
             calendar_sync.get_users()
-        assert "API Error" in str(exc_info.value)
+        assert "Failed to get users response" in str(exc_info.value)
 
 def test_process_event_success(calendar_sync, mock_event):
     """Test successful event processing."""
@@ -263,7 +287,7 @@ def test_sync_calendar_no_users(calendar_sync):
 
 def test_get_user_timezone_success(calendar_sync):
     """Test successful timezone retrieval."""
-    mock_response = Mock()
+    mock_response = Mock(status_code=200, ok=True)
     mock_response.json.return_value = {'timeZone': 'W. Europe Standard Time'}
     
     with patch.object(calendar_sync.account.connection, 'get', return_value=mock_response):
@@ -348,4 +372,304 @@ def test_duplicate_categories(calendar_sync):
     categories = calendar_sync.db.get_event_categories("test_event_004")
     assert len(categories) == 2  # Should only have "Work" and "Meeting"
     work_categories = [cat for cat in categories if cat.lower() == "work"]
-    assert len(work_categories) == 1  # Should only have one "Work" category 
\ No newline at end of file
+    assert len(work_categories) == 1  # Should only have one "Work" category 
+
+def test_windows_to_iana_uses_prebuilt_mapping():
+    """Test that Windows timezone names are resolved from the mapping built at import."""
+    assert CalendarSync.windows_to_iana('W. Europe Standard Time') == 'Europe/Amsterdam'
+    assert CalendarSync.windows_to_iana('Pacific Standard Time') == 'America/Los_Angeles'
+    assert CalendarSync.windows_to_iana('Unknown Standard Time') is None
+
+def test_load_windows_zones_reads_stored_mapping(tmp_path):
+    """Test that the CLDR mapping stored by update_windows_zones.py is loaded without parsing XML."""
+    mapping_path = tmp_path / 'windowsZones.json'
+    mapping_path.write_text('{"Test Standard Time": "Etc/GMT+5"}', encoding='utf-8')
+    with patch('calendar_sync.WINDOWS_ZONES_PATH', str(mapping_path)):
+        assert _load_windows_zones() == {'Test Standard Time': 'Etc/GMT+5'}
+    with patch('calendar_sync.WINDOWS_ZONES_PATH', str(tmp_path / 'missing.json')):
+        assert _load_windows_zones() == {}
+
+def test_parse_windows_zones_keeps_default_territory():
+    """Test that only the territory 001 entry of each CLDR mapZone group is kept."""
+    xml_content = b"""<supplementalData><windowsZones><mapTimezones>
+        <mapZone other="W. Europe Standard Time" territory="001" type="Europe/Berlin"/>
+        <mapZone other="W. Europe Standard Time" territory="NL" type="Europe/Amsterdam"/>
+    </mapTimezones></windowsZones></supplementalData>"""
+    assert parse_windows_zones(xml_content) == {'W. Europe Standard Time': 'Europe/Berlin'}
+
+def test_update_windows_zones_skips_fresh_mapping(tmp_path):
+    """Test that a mapping younger than max_age_days is not downloaded again."""
+    mapping_path = tmp_path / 'windowsZones.json'
+    mapping_path.write_text('{}', encoding='utf-8')
+    with patch('update_windows_zones.WINDOWS_ZONES_PATH', str(mapping_path)), \
+         patch('update_windows_zones.requests.get') as mock_get:
+        assert update_windows_zones(max_age_days=30) is False
+    mock_get.assert_not_called()
+
+def test_update_windows_zones_keeps_mapping_when_not_modified(tmp_path):
+    """Test that a 304 response keeps the stored mapping and only restarts its refresh interval."""
+    mapping_path = tmp_path / 'windowsZones.json'
+    mapping_path.write_text('{"Test Standard Time": "Etc/GMT+5"}', encoding='utf-8')
+    validators_path = tmp_path / 'windowsZones.json.etag'
+    validators_path.write_text('ETag: "abc"\n', encoding='utf-8')
+    stale = time.time() - 60 * 86400
+    os.utime(mapping_path, (stale, stale))
+
+    with patch('update_windows_zones.WINDOWS_ZONES_PATH', str(mapping_path)), \
+         patch('update_windows_zones.WINDOWS_ZONES_VALIDATORS_PATH', str(validators_path)), \
+         patch('update_windows_zones.requests.get', return_value=Mock(status_code=304)) as mock_get:
+        assert update_windows_zones(max_age_days=30) is False
+
+    assert mock_get.call_args.kwargs['headers']['If-None-Match'] == '"abc"'
+    assert mapping_path.read_text(encoding='utf-8') == '{"Test Standard Time": "Etc/GMT+5"}'
+    assert os.path.getmtime(mapping_path) > stale + 59 * 86400
+
+def test_get_user_timezone_is_cached(calendar_sync):
+    """Test that the mailbox settings are only requested once per user."""
+    mock_response = Mock(status_code=200, ok=True)
+    mock_response.json.return_value = {'timeZone': 'W. Europe Standard Time'}
+
+    with patch.object(calendar_sync, 'authenticate', return_value=True), \
+         patch.object(calendar_sync.account.connection, 'get', return_value=mock_response) as mock_get:
+        assert calendar_sync.get_user_timezone("test@example.com") == 'Europe/Amsterdam'
+        assert calendar_sync.get_user_timezone("test@example.com") == 'Europe/Amsterdam'
+        mock_get.assert_called_once()
+
+def test_invalidate_user_tz(calendar_sync):
+    """Test that an invalidated user timezone is requested again."""
+    mock_response = Mock(status_code=200, ok=True)
+    mock_response.json.return_value = {'timeZone': 'W. Europe Standard Time'}
+
+    with patch.object(calendar_sync, 'authenticate', return_value=True), \
+         patch.object(calendar_sync.account.connection, 'get', return_value=mock_response) as mock_get:
+        assert calendar_sync.get_user_timezone("test@example.com") == 'Europe/Amsterdam'
+        calendar_sync.invalidate_user_tz("test@example.com")
+        assert "test@example.com" not in calendar_sync._user_tz_cache
+        assert calendar_sync.get_user_timezone("test@example.com") == 'Europe/Amsterdam'
+        assert mock_get.call_count == 2
+
+def test_get_calendar_events_for_users_shares_batches(calendar_sync):
+    """Test that users share $batch requests and only users with a nextLink are paged."""
+    calendar_sync._user_tz_cache.update({'a@example.com': 'UTC', 'b@example.com': 'UTC'})
+    next_link = 'https://graph.microsoft.com/v1.0/users/a@example.com/calendarView/delta?$skiptoken=1'
+    first_batch = [
+        {'id': '0', 'status': 200, 'body': {'value': [{'id': 'e1'}], '@odata.nextLink': next_link}},
+        {'id': '1', 'status': 200, 'body': {'value': [{'id': 'e2'}]}},
+    ]
+    second_batch = [{'id': '0', 'status': 200, 'body': {'value': [{'id': 'e3'}], '@odata.deltaLink': 'delta-a'}}]
+
+    with patch.object(calendar_sync, '_make_batch_request', side_effect=[first_batch, second_batch]) as mock_batch:
+        events, delta_links = calendar_sync.get_calendar_events_for_users(
+            ['a@example.com', 'b@example.com'], date(2024, 1, 1), date(2024, 1, 2))
+
+    assert events == {'a@example.com': [{'id': 'e1'}, {'id': 'e3'}], 'b@example.com': [{'id': 'e2'}]}
+    assert delta_links == {'a@example.com': 'delta-a'}
+    assert mock_batch.call_count == 2
+    assert len(mock_batch.call_args_list[0].args[0]) == 2
+    assert mock_batch.call_args_list[1].args[0][0]['url'] == '/users/a@example.com/calendarView/delta?$skiptoken=1'
+
+def test_get_calendar_events_for_users_resyncs_expired_delta_link(calendar_sync):
+    """Test that a 410 Gone on a stored delta link falls back to a full sync."""
+    calendar_sync._user_tz_cache['a@example.com'] = 'UTC'
+    expired = [{'id': '0', 'status': 410, 'body': {}}]
+    full = [{'id': '0', 'status': 200, 'body': {'value': [{'id': 'e1'}], '@odata.deltaLink': 'delta-new'}}]
+
+    with patch.object(calendar_sync, '_make_batch_request', side_effect=[expired, full]) as mock_batch:
+        events, delta_links = calendar_sync.get_calendar_events_for_users(
+            ['a@example.com'], date(2024, 1, 1), date(2024, 1, 2),
+            delta_links={'a@example.com': 'https://graph.microsoft.com/v1.0/users/a@example.com/calendarView/delta?$deltatoken=old'})
+
+    assert events == {'a@example.com': [{'id': 'e1'}]}
+    assert delta_links == {'a@example.com': 'delta-new'}
+    assert mock_batch.call_args_list[0].args[0][0]['url'] == '/users/a@example.com/calendarView/delta?$deltatoken=old'
+    assert mock_batch.call_args_list[1].args[0][0]['url'].startswith('/users/a@example.com/calendarView/delta?startDateTime=')
+
+def test_process_events_skips_unchanged_events(calendar_sync):
+    """Test that events whose lastModifiedDateTime matches the stored value are not upserted again."""
+    calendar_sync.db.get_event_versions.return_value = {
+        'unchanged': (datetime(2024, 1, 1, 8, 0, 0, 3000), None),
+        'changed': (datetime(2024, 1, 1, 8, 0, 0), None),
+    }
+    events = [
+        graph_event('unchanged', last_modified='2024-01-01T08:00:00.0012345Z'),
+        graph_event('changed', last_modified='2024-01-01T08:30:00Z'),
+        graph_event('new', last_modified='2024-01-01T08:30:00Z'),
+    ]
+
+    assert calendar_sync.process_events(events, 'test@example.com') is True
+    upserted = calendar_sync.db.upsert_events_batch.call_args.args[0]
+    assert [row['event_id'] for row in upserted] == ['changed', 'new']
+
+def test_retry_delay_honors_retry_after_and_backs_off(calendar_sync):
+    """Test that Retry-After is honored and that the fallback delay grows exponentially up to the cap."""
+    assert calendar_sync._retry_delay(0, '7') == 7
+    assert calendar_sync._retry_delay(0, 'Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < calendar_sync._retry_delay(0, retry_at.strftime('%a, %d %b %Y %H:%M:%S GMT')) <= 30
+    with patch('calendar_sync.random.random', return_value=0.0):
+        assert calendar_sync._retry_delay(0) == calendar_sync.base_delay
+        assert calendar_sync._retry_delay(2) == calendar_sync.base_delay * 4
+        assert calendar_sync._retry_delay(10) == calendar_sync.max_delay
+    with patch('calendar_sync.random.random', return_value=1.0):
+        assert calendar_sync._retry_delay(0) == calendar_sync.base_delay * (1 + calendar_sync.jitter)
+
+def test_make_request_with_retry_retries_throttled_responses(calendar_sync):
+    """Test that a 429 response is retried instead of being returned."""
+    throttled = Mock(status_code=429, ok=False, headers={'Retry-After': '0'})
+    success = Mock(status_code=200, ok=True, headers={})
+
+    with patch.object(calendar_sync.account.connection, 'get', side_effect=[throttled, success]) as mock_get, \
+         patch('calendar_sync.time.sleep') as mock_sleep:
+        assert calendar_sync._make_request_with_retry('https://graph.microsoft.com/v1.0/users') is success
+        assert mock_get.call_count == 2
+        mock_sleep.assert_called_once_with(0)
+
+def test_make_request_with_retry_gives_up_on_client_errors(calendar_sync):
+    """Test that non-retryable error responses are not retried."""
+    not_found = Mock(status_code=404, ok=False, headers={})
+
+    with patch.object(calendar_sync.account.connection, 'get', return_value=not_found) as mock_get:
+        assert calendar_sync._make_request_with_retry('https://graph.microsoft.com/v1.0/users') is None
+        mock_get.assert_called_once()
+
+def test_parse_date_without_ciso8601(calendar_sync):
+    """Test that the fromisoformat fallback handles the 7 fractional digits sent by Graph."""
+    _parse_graph_datetime.cache_clear()
+    with patch('calendar_sync.ciso8601', None):
+        assert calendar_sync._parse_date('2024-01-01T09:00:00.1234567') == datetime(2024, 1, 1, 9, 0, 0, 123456, tzinfo=timezone.utc)
+        assert calendar_sync._parse_date('2024-01-01T09:00:00Z') == datetime(2024, 1, 1, 9, 0, 0, tzinfo=timezone.utc)
+
+def test_get_calendar_events_for_users_streams_pages(calendar_sync):
+    """Test that pages are handed to on_page as they arrive instead of being collected."""
+    calendar_sync._user_tz_cache['a@example.com'] = 'UTC'
+    next_link = 'https://graph.microsoft.com/v1.0/users/a@example.com/calendarView/delta?$skiptoken=1'
+    first_batch = [{'id': '0', 'status': 200, 'body': {'value': [{'id': 'e1'}], '@odata.nextLink': next_link}}]
+    second_batch = [{'id': '0', 'status': 200, 'body': {'value': [{'id': 'e2'}], '@odata.deltaLink': 'delta-a'}}]
+    pages = []
+
+    with patch.object(calendar_sync, '_make_batch_request', side_effect=[first_batch, second_batch]):
+        events, delta_links = calendar_sync.get_calendar_events_for_users(
+            ['a@example.com'], date(2024, 1, 1), date(2024, 1, 2),
+            on_page=lambda user_email, page: pages.append((user_email, page)))
+
+    assert pages == [('a@example.com', [{'id': 'e1'}]), ('a@example.com', [{'id': 'e2'}])]
+    assert events == {'a@example.com': []}
+    assert delta_links == {'a@example.com': 'delta-a'}
+
+def test_sync_users_continues_past_users_without_mailbox(calendar_sync, mock_db):
+    """Test that a 404 for one user in a $batch does not stop the other users from being stored."""
+    calendar_sync._user_tz_cache.update({'a@example.com': 'UTC', 'b@example.com': 'UTC'})
+    mock_db.get_delta_links.return_value = {}
+    batch = [
+        {'id': '0', 'status': 404, 'body': {'error': {'code': 'MailboxNotEnabledForRESTAPI'}}},
+        {'id': '1', 'status': 200, 'body': {'value': [{'id': 'e1'}], '@odata.deltaLink': 'delta-b'}},
+    ]
+
+    with patch.object(calendar_sync, 'prefetch_user_timezones'), \
+         patch.object(calendar_sync, '_make_batch_request', return_value=batch), \
+         patch.object(calendar_sync, 'process_events', return_value=True) as process_events:
+        calendar_sync._sync_users(['a@example.com', 'b@example.com'], date(2024, 1, 1), date(2024, 1, 2))
+
+    process_events.assert_called_once_with([{'id': 'e1'}], 'b@example.com')
+    mock_db.save_delta_link.assert_called_once_with(
+        'b@example.com', 'delta-b', date(2024, 1, 1), date(2024, 1, 2), full_sync=True)
+
+def test_sync_users_writer_stores_pages_before_saving_delta_links(calendar_sync, mock_db):
+    """Test that the writer thread stores every page and that a failed store keeps the old delta link."""
+    mock_db.get_delta_links.return_value = {}
+    users = ['a@example.com', 'b@example.com']
+    sent_pages = [(user_email, [{'id': f'{user_email}-{page}'}]) for page in range(5) for user_email in users]
+
+    def fetch(user_emails, start_date, end_date, delta_links=None, on_page=None):
+        for user_email, events in sent_pages:
+            on_page(user_email, events)
+        return {user_email: [] for user_email in user_emails}, {'a@example.com': 'delta-a', 'b@example.com': 'delta-b'}
+
+    stored_pages = []
+    def process_events(events, user_email):
+        stored_pages.append((user_email, events))
+        return user_email != 'b@example.com'
+
+    with patch.object(calendar_sync, 'prefetch_user_timezones'), \
+         patch.object(calendar_sync, 'get_calendar_events_for_users', side_effect=fetch), \
+         patch.object(calendar_sync, 'process_events', side_effect=process_events):
+        calendar_sync._sync_users(users, date(2024, 1, 1), date(2024, 1, 2))
+
+    assert stored_pages == sent_pages
+    mock_db.save_delta_link.assert_called_once_with(
+        'a@example.com', 'delta-a', date(2024, 1, 1), date(2024, 1, 2), full_sync=True)
+
+def test_process_events_compares_change_keys(calendar_sync):
+    """Test that the Graph changeKey decides whether a stored event changed."""
+    stored_time = datetime(2024, 1, 1, 8, 0, 0)
+    calendar_sync.db.get_event_versions.return_value = {
+        'same': (stored_time, 'key-1'),
+        'edited': (stored_time, 'key-1'),
+    }
+    events = [graph_event('same', change_key='key-1'), graph_event('edited', change_key='key-2')]
+
+    assert calendar_sync.process_events(events, 'test@example.com') is True
+    upserted = calendar_sync.db.upsert_events_batch.call_args.args[0]
+    assert [row['event_id'] for row in upserted] == ['edited']
+
+def test_prefetch_user_timezones_uses_stored_timezones(calendar_sync, mock_db):
+    """Test that stored timezones are reused and only missing users are fetched."""
+    mock_db.get_user_timezones.return_value = {'a@example.com': 'Europe/Amsterdam'}
+    with patch.object(calendar_sync, '_batch_get', return_value={
+        '0': {'status': 200, 'body': {'timeZone': 'W. Europe Standard Time'}}
+    }) as batch_get:
+        calendar_sync.prefetch_user_timezones(['a@example.com', 'b@example.com'])
+
+    batch_get.assert_called_once_with({'0': '/users/b@example.com/mailboxSettings'})
+    mock_db.save_user_timezones.assert_called_once_with({'b@example.com': 'Europe/Amsterdam'})
+    assert calendar_sync._user_tz_cache['a@example.com'] == 'Europe/Amsterdam'
+
+def test_in_memory_token_backend_writes_on_flush(tmp_path):
+    """Test that saved tokens stay in memory until the backend is flushed."""
+    token_file = tmp_path / 'o365_token.txt'
+    backend = InMemoryTokenBackend(token_path=token_file)
+    backend.token = {'access_token': 'abc', 'expires_at': 0}
+
+    assert backend.save_token()
+    assert not token_file.exists()
+    assert backend.load_token() == backend.token
+
+    backend.flush()
+    assert token_file.exists()
+
+def test_authenticate_flushes_token(calendar_sync):
+    """Test that a fresh token is written right after authenticating instead of only at exit."""
+    mock_account_instance = Mock()
+    type(mock_account_instance).is_authenticated = property(lambda self: False)
+    mock_account_instance.authenticate.return_value = True
+    calendar_sync.account = mock_account_instance
+
+    with patch.object(calendar_sync._token_backend, 'flush') as flush:
+        assert calendar_sync.authenticate() is True
+    flush.assert_called_once_with()
+
+def test_upsert_events_batch_merges_categories_by_case():
+    """Test that category names differing only in case are sent as one category."""
+    def stored_event(event_id, categories):
+        return {
+            'event_id': event_id,
+            'user_email': 'test@example.com',
+            'user_name': 'Test User',
+            'subject': 'Test Event',
+            'description': None,
+            'start_date': datetime(2024, 1, 1, 9, 0),
+            'end_date': datetime(2024, 1, 1, 10, 0),
+            'last_modified': datetime(2024, 1, 1, 8, 0),
+            'is_deleted': False,
+            'categories': categories,
+        }
+
+    with patch('database.pyodbc.connect') as mock_connect, \
+         patch.object(DatabaseManager, 'initialize_table'):
+        db = DatabaseManager(pool_size=1)
+        assert db.upsert_events_batch([stored_event('e1', ['Work']), stored_event('e2', ['work', 'Work'])]) is True
+
+    cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+    rows = {sql.split()[2]: params for sql, params in (c.args for c in cursor.executemany.call_args_list)}
+    assert rows['#temp_categories'] == [('Work',)]
+    assert rows['#temp_event_categories'] == [('e1', 'Work'), ('e2', 'Work')]
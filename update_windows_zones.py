@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+import requests
+from config import WINDOWS_ZONES_PATH, logger
+
+CLDR_WINDOWS_ZONES_URL = 'https://raw.githubusercontent.com/unicode-org/cldr/master/common/supplemental/windowsZones.xml'
+WINDOWS_ZONES_VALIDATORS_PATH = WINDOWS_ZONES_PATH + '.etag'
+
+def _read_windows_zones_validators():
+    """Read the ETag/Last-Modified values stored next to the cached CLDR mapping."""
+    validators = {}
+    if os.path.exists(WINDOWS_ZONES_PATH) and os.path.exists(WINDOWS_ZONES_VALIDATORS_PATH):
+        with open(WINDOWS_ZONES_VALIDATORS_PATH, encoding='utf-8') as f:
+            for line in f:
+                name, _, value = line.rstrip('\n').partition(': ')
+                if value:
+                    validators[name] = value
+    return validators
+
+def parse_windows_zones(xml_content):
+    """Build the Windows->IANA mapping for territory 001 from the CLDR windowsZones.xml."""
+    windows_zones = {}
+    # Stream the XML instead of building the whole tree, releasing each element once read
+    for _, element in ET.iterparse(io.BytesIO(xml_content), events=('end',)):
+        if element.tag == 'mapZone' and element.get('territory') == '001':
+            windows_zones[element.get('other')] = element.get('type')
+        element.clear()
+    return windows_zones
+
+def update_windows_zones(max_age_days=None):
+    """Download the CLDR windowsZones.xml and store its parsed mapping next to calendar_sync.
+    Sends If-None-Match/If-Modified-Since so an unchanged file costs a 304 instead
+    of a full download.
+
+    Args:
+        max_age_days (int, optional): Skip the download while the stored mapping is
+            younger than this many days.
+
+    Returns:
+        bool: True if a new mapping was written.
+    """
+    if max_age_days is not None and os.path.exists(WINDOWS_ZONES_PATH):
+        age_days = (time.time() - os.path.getmtime(WINDOWS_ZONES_PATH)) / 86400
+        if age_days < max_age_days:
+            logger.debug("Stored CLDR mapping is %.1f days old, not refreshing", age_days)
+            return False
+
+    validators = _read_windows_zones_validators()
+    headers = {'User-Agent': 'Mozilla/5.0'}  # Add user agent to avoid potential blocking
+    if 'ETag' in validators:
+        headers['If-None-Match'] = validators['ETag']
+    if 'Last-Modified' in validators:
+        headers['If-Modified-Since'] = validators['Last-Modified']
+
+    response = requests.get(CLDR_WINDOWS_ZONES_URL, headers=headers, timeout=30)
+    if response.status_code == 304:
+        logger.info("CLDR windowsZones.xml not modified, keeping the cached mapping")
+        # Restart the refresh interval, the stored mapping is known to be current
+        os.utime(WINDOWS_ZONES_PATH)
+        return False
+    response.raise_for_status()
+
+    windows_zones = parse_windows_zones(response.content)
+    with open(WINDOWS_ZONES_PATH, 'w', encoding='utf-8') as f:
+        json.dump(windows_zones, f, indent=1, sort_keys=True)
+    with open(WINDOWS_ZONES_VALIDATORS_PATH, 'w', encoding='utf-8') as f:
+        f.writelines(f"{name}: {response.headers[name]}\n" for name in ('ETag', 'Last-Modified') if response.headers.get(name))
+    logger.info(f"Stored {len(windows_zones)} Windows timezone mappings in {WINDOWS_ZONES_PATH}")
+    return True
+
+if __name__ == "__main__":
+    update_windows_zones()